@@ -0,0 +1,42 @@
+"""Throughput of ``from_tensor_slices(x).batch(n)`` over a float array, row by row and with the batches gathered
+by the source.
+
+``rows`` feeds the same rows through a generator, so every row is a sample and is copied into its batch one at
+a time, which was the only way before the source could be read by index. ``sliced`` is the path of
+``from_tensor_slices`` over arrays and tensors, every batch is a single slice of the array.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/batch.py``
+"""
+import argparse
+import time
+
+import numpy as np
+
+import torch_data
+
+
+def run(name, ds, rows):
+    wall = time.perf_counter()
+    count = sum(len(batch) for batch in ds)
+    wall = time.perf_counter() - wall
+
+    assert count == rows, count
+    print(f'{name:<7} samples={count:<8} {count / wall:14.1f} samples/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=1_000_000)
+    parser.add_argument('--features', type=int, default=32)
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    x = np.random.default_rng(0).random((args.n, args.features), dtype=np.float32)
+    rows = args.n // args.batch_size * args.batch_size
+
+    run('rows', torch_data.Dataset.from_generator(iter, args=(x,)).batch(args.batch_size), rows)
+    run('sliced', torch_data.Dataset.from_tensor_slices(x).batch(args.batch_size), rows)
+
+
+if __name__ == '__main__':
+    main()
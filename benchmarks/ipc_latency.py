@@ -0,0 +1,51 @@
+"""Per-sample IPC cost of a parallel map with tiny samples.
+
+Every sample carries the time it was produced, so the consumer can measure the latency of the round trip
+to a worker process and back.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/ipc_latency.py``
+"""
+import argparse
+import statistics
+import time
+
+import torch_data
+
+
+def identity(x):
+    return x
+
+
+def timestamps(n):
+    for _ in range(n):
+        yield time.perf_counter()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    def make_dataset(n):
+        ds = torch_data.Dataset.from_generator(timestamps, args=(n,))
+        return ds.map(identity, num_parallel_calls=args.workers, ordered=True)
+
+    list(make_dataset(10))  # warm up the pool
+
+    latencies = []
+    wall = time.perf_counter()
+    for t in make_dataset(args.n):
+        latencies.append(time.perf_counter() - t)
+    wall = time.perf_counter() - wall
+
+    latencies.sort()
+    print(f'samples={len(latencies)} workers={args.workers} '
+          f'cost={1e6 * wall / len(latencies):.1f}us/sample '
+          f'latency: mean={1e6 * statistics.mean(latencies):.1f}us '
+          f'p50={1e6 * latencies[len(latencies) // 2]:.1f}us '
+          f'p99={1e6 * latencies[int(len(latencies) * 0.99)]:.1f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Throughput of a parallel map with cheap samples across chunk sizes of the task dispatch.
+
+``auto`` is the default adaptive chunk size, which grows until a chunk takes about 10ms in a worker.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/map_chunks.py``
+"""
+import argparse
+import time
+
+import torch_data
+
+
+def cheap(x):
+    return x * 2
+
+
+def tokenize(x):
+    return str(x).split('0')
+
+
+def run(name, map_func, n, num_parallel_calls, ordered, chunk_size):
+    ds = torch_data.Dataset.from_generator(range, args=(n,))
+    ds = ds.map(map_func, num_parallel_calls=num_parallel_calls, ordered=ordered, chunk_size=chunk_size)
+
+    wall = time.perf_counter()
+    count = sum(1 for _ in ds)
+    wall = time.perf_counter() - wall
+
+    print(f'{name:<8} ordered={ordered!s:<5} chunk={chunk_size or "auto"!s:<5} samples={count:<6} '
+          f'{count / wall:10.1f} samples/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    # warm up the worker pool, so process start-up is not measured
+    run('warmup', cheap, 10, args.workers, False, 1)
+
+    for ordered in (False, True):
+        for name, map_func in (('cheap', cheap), ('tokenize', tokenize)):
+            for chunk_size in (1, 4, 16, 64, 256, None):
+                run(name, map_func, args.n, args.workers, ordered, chunk_size)
+
+
+if __name__ == '__main__':
+    main()
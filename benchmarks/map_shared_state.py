@@ -0,0 +1,66 @@
+"""Memory of the workers of a parallel map, whose function captures a large array.
+
+The proportional set size (PSS) splits shared pages between the processes which map them, so its sum over the
+workers is about the size of the array when it is shared and about ``workers`` times that when every worker has
+its own copy.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/map_shared_state.py``
+"""
+import argparse
+import time
+
+import numpy as np
+
+import torch_data
+
+
+def _memory(pid):
+    # kilobytes of the resident and proportional set sizes of a process
+    sizes = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                sizes[key] = int(value.split()[0])
+
+    return sizes['Rss'], sizes['Pss']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    table = np.ones(args.mb << 17, dtype=np.float64)  # 8 bytes per item
+
+    def lookup(x):
+        # touches every page, so the whole array is resident
+        return float(table[::512].sum()) + x
+
+    with torch_data.ProcessPool(args.workers, lazy=False) as pool:
+        ds = torch_data.Dataset.from_generator(range, args=(4 * args.workers,))
+
+        # the first tasks import the modules of the workers, they are not measured
+        list(ds.map(float, pool=pool, chunk_size=1))
+
+        pids = [p._process.pid for p in pool._pool]
+        base = [_memory(pid) for pid in pids]
+
+        ds = ds.map(lookup, pool=pool, chunk_size=1)
+
+        wall = time.perf_counter()
+        for _ in range(2):
+            list(ds)
+        wall = time.perf_counter() - wall
+
+        after = [_memory(pid) for pid in pids]
+
+    rss = sum(a[0] - b[0] for a, b in zip(after, base)) / 1024
+    pss = sum(a[1] - b[1] for a, b in zip(after, base)) / 1024
+    print(f'array={args.mb}MB workers={args.workers} two epochs={wall:.2f}s '
+          f'workers RSS +{rss:.0f}MB, PSS +{pss:.0f}MB')
+
+
+if __name__ == '__main__':
+    main()
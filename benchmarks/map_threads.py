@@ -0,0 +1,51 @@
+"""Throughput of a parallel map with torch and numpy math, with and without the limit of the intra-op threads.
+
+``threads=default`` keeps the thread pools of the libraries, so every worker starts a thread per CPU and the
+machine is oversubscribed ``workers`` times. ``threads=1`` is the default of ``ProcessPool``.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/map_threads.py``
+"""
+import argparse
+import os
+import time
+
+import torch_data
+
+
+def matmul(x):
+    import numpy as np
+    import torch
+
+    a = torch.full((256, 256), float(x))
+    b = np.full((256, 256), float(x))
+    return float((a @ a).sum()) + float((b @ b).sum())
+
+
+def run(n, workers, num_threads):
+    with torch_data.ProcessPool(workers, num_threads=num_threads, lazy=False) as pool:
+        ds = torch_data.Dataset.from_generator(range, args=(n,))
+
+        # the first tasks import the modules of the workers, they are not measured
+        warmup = torch_data.Dataset.from_generator(range, args=(2 * workers,))
+        list(warmup.map(matmul, pool=pool, chunk_size=1))
+
+        wall = time.perf_counter()
+        count = sum(1 for _ in ds.map(matmul, pool=pool))
+        wall = time.perf_counter() - wall
+
+    print(f'workers={workers:<3} threads={num_threads or "default"!s:<8} samples={count:<6} '
+          f'{count / wall:10.1f} samples/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    for num_threads in (None, 1):
+        run(args.n, args.workers, num_threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Throughput of ``Dataset.map(..., num_parallel_calls=N)``.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/parallel_map.py``
+"""
+import argparse
+import time
+
+import torch_data
+
+
+def cheap(x):
+    return x * 2
+
+
+def busy(x):
+    s = 0
+    for i in range(20000):
+        s += i
+    return x + s
+
+
+def run(name, map_func, n, num_parallel_calls, ordered):
+    ds = torch_data.Dataset.from_generator(range, args=(n,))
+    ds = ds.map(map_func, num_parallel_calls=num_parallel_calls, ordered=ordered)
+
+    wall = time.perf_counter()
+    count = sum(1 for _ in ds)
+    wall = time.perf_counter() - wall
+
+    print(f'{name:<8} ordered={ordered!s:<5} workers={num_parallel_calls:<3} samples={count:<6} '
+          f'{count / wall:10.1f} samples/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    # warm up the worker pool, so process start-up is not measured
+    run('warmup', cheap, 10, args.workers, False)
+
+    for ordered in (False, True):
+        run('cheap', cheap, args.n, args.workers, ordered)
+        run('busy', busy, args.n // 10, args.workers, ordered)
+
+
+if __name__ == '__main__':
+    main()
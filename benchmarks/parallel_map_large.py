@@ -0,0 +1,54 @@
+"""Throughput of a parallel map over large samples (3x224x224 float32 images by default).
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/parallel_map_large.py``
+"""
+import argparse
+import time
+
+import numpy as np
+
+import torch_data
+
+
+def flip(x):
+    return x[..., ::-1].copy()
+
+
+def flip_tensor(x):
+    return x.flip(-1)
+
+
+def run(name, make_sample, map_func, n, num_parallel_calls):
+    ds = torch_data.Dataset.from_generator(lambda: (make_sample() for _ in range(n)))
+    ds = ds.map(map_func, num_parallel_calls=num_parallel_calls)
+
+    wall = time.perf_counter()
+    count = sum(1 for _ in ds)
+    wall = time.perf_counter() - wall
+
+    print(f'{name:<8} workers={num_parallel_calls:<3} samples={count:<5} {count / wall:8.1f} samples/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--shape', type=int, nargs='+', default=[3, 224, 224])
+    args = parser.parse_args()
+
+    shape = tuple(args.shape)
+    image = np.random.rand(*shape).astype(np.float32)
+
+    run('warmup', lambda: image, flip, 10, args.workers)
+    run('numpy', lambda: image, flip, args.n, args.workers)
+
+    try:
+        import torch
+        tensor = torch.from_numpy(image)
+        run('torch', lambda: tensor, flip_tensor, args.n, args.workers)
+    except (ImportError, ModuleNotFoundError):
+        pass
+
+
+if __name__ == '__main__':
+    main()
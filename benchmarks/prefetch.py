@@ -0,0 +1,53 @@
+"""CPU time spent per element by a prefetching pipeline with a slow source and a slow consumer.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/prefetch.py``
+"""
+import argparse
+import asyncio
+import time
+
+import torch_data
+
+
+def make_dataset(n, source_delay, buffer_size):
+    async def slow_source():
+        for i in range(n):
+            await asyncio.sleep(source_delay)
+            yield i
+
+    return torch_data.Dataset.from_generator(slow_source).prefetch(buffer_size)
+
+
+async def consume(ds, consumer_delay):
+    n = 0
+    async for _ in ds:
+        if consumer_delay:
+            await asyncio.sleep(consumer_delay)
+        n += 1
+    return n
+
+
+def run(name, n, source_delay, consumer_delay, buffer_size):
+    ds = make_dataset(n, source_delay, buffer_size)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    count = asyncio.run(consume(ds, consumer_delay))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    print(f'{name:<16} elements={count:<6} wall={wall:7.3f}s cpu={cpu:7.3f}s '
+          f'cpu/element={1e6 * cpu / count:9.1f}us')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.005)
+    parser.add_argument('--buffer-size', type=int, default=8)
+    args = parser.parse_args()
+
+    run('slow source', args.n, args.delay, 0, args.buffer_size)
+    run('slow consumer', args.n, 0, args.delay, args.buffer_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Stall at the epoch boundary of a parallel map, with an epoch loop around the dataset and with ``repeat``.
+
+The stall is the time between the last element of an epoch and the first element of the next one. With the epoch
+loop, the next epoch is started only when the previous one has been consumed, so its first sample has to go
+through the workers. ``repeat`` runs the next epoch ahead.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/repeat.py``
+"""
+import argparse
+import statistics
+import time
+
+import torch_data
+
+
+def work(x):
+    time.sleep(0.005)
+    return x
+
+
+def stalls(iterator, n, epochs):
+    # the time before the first element of every epoch but the first one
+    result = []
+    for epoch in range(epochs):
+        for i in range(n):
+            started = time.perf_counter()
+            next(iterator)
+            if i == 0 and epoch > 0:
+                result.append(time.perf_counter() - started)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=200)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    ds = torch_data.Dataset.from_generator(range, args=(args.n,))
+    ds = ds.map(work, num_parallel_calls=args.workers, ordered=True)
+
+    # warm up the worker pool, so process start-up is not measured
+    list(ds)
+
+    def epoch_loop():
+        for _ in range(args.epochs):
+            yield from ds
+
+    for name, iterator in (('loop', epoch_loop()), ('repeat', iter(ds.repeat(args.epochs)))):
+        result = stalls(iterator, args.n, args.epochs)
+        print(f'{name:<7} epochs={args.epochs} samples/epoch={args.n} '
+              f'boundary stall: mean={statistics.mean(result) * 1000:7.2f}ms max={max(result) * 1000:7.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
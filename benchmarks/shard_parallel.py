@@ -0,0 +1,52 @@
+"""Throughput of a pipeline with an expensive source: parallel map vs. a replica of the pipeline per worker.
+
+With ``map(num_parallel_calls=N)`` every sample is read in the parent, ``shard_parallel(N)`` reads the shards
+of the source in the workers, the reader is shard-aware and skips the records of other shards.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/shard_parallel.py``
+"""
+import argparse
+import time
+
+import torch_data
+
+
+def read(n, shard=None):
+    index, num_shards = shard or (0, 1)
+    for i in range(index, n, num_shards):
+        s = 0
+        for j in range(2000):  # parsing of a record
+            s += j
+        yield i + s
+
+
+def decode(x):
+    return str(x).encode()
+
+
+def run(name, ds):
+    wall = time.perf_counter()
+    count = sum(1 for _ in ds)
+    wall = time.perf_counter() - wall
+
+    print(f'{name:<16} samples={count:<6} {count / wall:10.1f} samples/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    ds = torch_data.Dataset.from_generator(read, args=(args.n,), shard_aware=True)
+
+    # warm up the worker pool, so process start-up is not measured
+    list(torch_data.Dataset.from_generator(range, args=(10,)).map(decode, num_parallel_calls=args.workers))
+
+    run('serial', ds.map(decode))
+    run('parallel map', ds.map(decode, num_parallel_calls=args.workers))
+    run('shard parallel', ds.map(decode).shard_parallel(args.workers))
+
+
+if __name__ == '__main__':
+    main()
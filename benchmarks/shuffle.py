@@ -0,0 +1,55 @@
+"""Throughput of the shuffle buffer for buffer sizes from 1k to 1M elements.
+
+``insert`` is the previous buffer, every element was inserted at a random position and the first one was returned,
+both move ``buffer_size`` elements. ``slot`` returns a random slot and refills it with the next element. Each run
+shuffles ``2 * buffer_size`` elements, so half of them pass through a full buffer. ``insert`` is skipped above
+``--max-insert`` elements, its fill phase alone is quadratic.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/shuffle.py``
+"""
+import argparse
+import random
+import time
+
+import torch_data
+
+
+def insert_shuffle(n, buffer_size):
+    rand = random.Random(0)
+    buffer = []
+    source = iter(range(n))
+
+    for sample in source:
+        buffer.insert(rand.randint(0, len(buffer)), sample)
+        if len(buffer) == buffer_size:
+            yield buffer.pop(0)
+
+    while buffer:
+        yield buffer.pop(0)
+
+
+def run(name, ds, n, buffer_size):
+    wall = time.perf_counter()
+    count = sum(1 for _ in ds)
+    wall = time.perf_counter() - wall
+
+    assert count == n, count
+    print(f'{name:<7} buffer={buffer_size:<8} samples={n:<8} {n / wall:12.1f} samples/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--max-insert', type=int, default=100_000)
+    args = parser.parse_args()
+
+    for buffer_size in args.sizes:
+        n = 2 * buffer_size
+        if buffer_size <= args.max_insert:
+            run('insert', torch_data.Dataset.from_generator(insert_shuffle, args=(n, buffer_size)), n, buffer_size)
+
+        run('slot', torch_data.Dataset.from_generator(range, args=(n,)).shuffle(buffer_size, seed=0), n, buffer_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Per-element overhead of synchronous iteration (``for sample in dataset``) over tiny samples.
+
+Run from the repository root: ``PYTHONPATH=src python benchmarks/sync_iter.py``
+"""
+import argparse
+import time
+
+import torch_data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=100000)
+    parser.add_argument('--step-time', type=float, default=0.0,
+                        help='simulated training step per element (seconds)')
+    args = parser.parse_args()
+
+    ds = torch_data.Dataset.from_generator(range, args=(args.n,)).map(lambda x: x * 2)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    count = 0
+    for _ in ds:
+        if args.step_time:
+            time.sleep(args.step_time)
+        count += 1
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    print(f'elements={count} wall={wall:.3f}s cpu={cpu:.3f}s '
+          f'per element: wall={1e6 * wall / count:.1f}us cpu={1e6 * cpu / count:.1f}us')
+
+
+if __name__ == '__main__':
+    main()
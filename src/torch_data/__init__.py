@@ -1,2 +1,4 @@
 
 from ._dataset import Dataset
+from ._ops import ProcessPool
+from ._records import RecordWriter
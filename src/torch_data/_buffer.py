@@ -0,0 +1,134 @@
+import asyncio
+import collections
+import threading
+
+
+class BufferClosed(Exception):
+    pass
+
+
+def _set_done(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+class ThreadSafeBuffer:
+    """Bounded FIFO buffer shared between threads and event loops.
+
+    Blocking (``put``/``get``) and awaitable (``aput``/``aget``) methods can be mixed freely,
+    waiting sides sleep until they are notified, so an idle buffer does not consume CPU.
+    """
+
+    def __init__(self, maxsize=0):
+        self._maxsize = maxsize
+        self._items = collections.deque()
+        self._closed = False
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+        self._async_getters = []
+        self._async_putters = []
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        with self._lock:
+            while not self._closed and self._full():
+                self._not_full.wait()
+
+            self._append(item)
+
+    def get(self):
+        with self._lock:
+            while not self._closed and not self._items:
+                self._not_empty.wait()
+
+            return self._popleft()
+
+    async def aput(self, item):
+        while True:
+            with self._lock:
+                if self._closed or not self._full():
+                    self._append(item)
+                    return
+
+                fut = self._add_waiter(self._async_putters)
+
+            await fut
+
+    async def aget(self):
+        while True:
+            with self._lock:
+                if self._closed or self._items:
+                    return self._popleft()
+
+                fut = self._add_waiter(self._async_getters)
+
+            await fut
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            self._wake(self._async_getters)
+            self._wake(self._async_putters)
+
+    def _full(self):
+        return 0 < self._maxsize <= len(self._items)
+
+    def _append(self, item):
+        if self._closed:
+            raise BufferClosed()
+
+        self._items.append(item)
+
+        self._not_empty.notify()
+        self._wake(self._async_getters)
+
+    def _popleft(self):
+        if not self._items:
+            raise BufferClosed()
+
+        item = self._items.popleft()
+
+        self._not_full.notify()
+        self._wake(self._async_putters)
+
+        return item
+
+    @staticmethod
+    def _add_waiter(waiters):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        waiters.append((loop, fut))
+        return fut
+
+    @staticmethod
+    def _wake(waiters):
+        if not waiters:
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        for loop, fut in waiters:
+            if loop is running_loop:
+                _set_done(fut)
+            else:
+                try:
+                    loop.call_soon_threadsafe(_set_done, fut)
+                except RuntimeError:  # the loop has been closed
+                    pass
+
+        waiters.clear()
@@ -1,6 +1,11 @@
 import asyncio
 import aioitertools
 import os
+import threading
+from contextlib import suppress
+
+from . import _shard
+from ._buffer import BufferClosed, ThreadSafeBuffer
 
 
 class _EmptyDatasetIterator:
@@ -22,7 +27,8 @@ class _EmptyDatasetSource:
 class _DatasetAsyncIterator:
     def __init__(self, session_id, source):
         self._session_id = session_id
-        self._source_iter = source.get_iter(session_id)
+        # a dataset iterated inside a sharded pipeline, e.g. returned by `map_func`, is not sharded itself
+        self._source_iter = _shard.get_iter(source, session_id, None)
 
     def __aiter__(self):
         return self
@@ -32,69 +38,99 @@ class _DatasetAsyncIterator:
 
 
 class _DatasetSyncIterator:
-    def __init__(self, async_iter):
-        from signal import SIGINT, SIGTERM
+    class _Error:
+        def __init__(self, exc):
+            self.exc = exc
 
-        self._async_iter = aioitertools.iter(async_iter)
+    @staticmethod
+    async def _produce(async_iter, buffer):
+        try:
+            async for sample in async_iter:
+                await buffer.aput(sample)
+        except (asyncio.CancelledError, BufferClosed):
+            pass
+        except Exception as e:
+            with suppress(BufferClosed):
+                await buffer.aput(_DatasetSyncIterator._Error(e))
+        finally:
+            buffer.close()
 
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            import nest_asyncio
-            nest_asyncio.apply(loop)
+    @staticmethod
+    def _thread_main(loop, task):
+        asyncio.set_event_loop(loop)
 
-            old_loop = loop
-            loop = asyncio.new_event_loop()
-        else:
-            old_loop = None
+        try:
+            loop.run_until_complete(task)
+        finally:
+            tasks = asyncio.all_tasks(loop)
+            for t in tasks:
+                t.cancel()
 
-        def raise_keyboard():
-            raise KeyboardInterrupt()
+            with suppress(asyncio.CancelledError):
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
 
-        def raise_exit():
-            raise SystemExit()
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
 
-        loop.add_signal_handler(SIGINT, raise_keyboard)
-        loop.add_signal_handler(SIGTERM, raise_exit)
+    def __init__(self, async_iter, buffer_size=4):
+        self._buffer = ThreadSafeBuffer(buffer_size)
 
-        self._old_loop = old_loop
-        self._loop = loop
+        # the pipeline runs continuously in its own loop, `__next__` only dequeues ready samples
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(_DatasetSyncIterator._produce(async_iter, self._buffer))
 
-    async def __next(self):
-        return await aioitertools.next(self._async_iter)
+        self._thread = threading.Thread(target=_DatasetSyncIterator._thread_main,
+                                        args=(self._loop, self._task), daemon=True)
+        self._thread.start()
 
     def __del__(self):
-        if self._old_loop is not None:
-            self._loop.close()
+        self.close()
 
     def __iter__(self):
         return self
 
     def __next__(self):
+        if self._thread is None:
+            raise StopIteration()
+
         try:
-            task = self.__next()
-            if self._old_loop is None:
-                result = self._loop.run_until_complete(task)
-            else:
-                try:
-                    asyncio.set_event_loop(self._loop)
-                    result = self._loop.run_until_complete(task)
-                finally:
-                    asyncio.set_event_loop(self._old_loop)
-
-            return result
-        except StopAsyncIteration:
+            sample = self._buffer.get()
+        except BufferClosed:
             raise StopIteration()
 
+        if isinstance(sample, _DatasetSyncIterator._Error):
+            self.close()
+            raise sample.exc
+        else:
+            return sample
+
+    def close(self):
+        thread = getattr(self, '_thread', None)
+        if thread is None:
+            return
+
+        self._buffer.close()
+        try:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        except RuntimeError:  # the loop has already been closed
+            pass
+
+        if thread is not threading.current_thread():
+            thread.join()
+        self._thread = None
+
 
 class Dataset:
     @staticmethod
-    def from_generator(generator, args=None):
+    def from_generator(generator, args=None, *, shard_aware=False):
         from ._sources import GeneratorDataSource
 
         assert callable(generator), 'generator: Must be callable'
         assert args is None or isinstance(args, (list, tuple)), 'args: Must be None or a tuple'
+        assert isinstance(shard_aware, bool), 'shard_aware: must be a boolean'
 
-        source = GeneratorDataSource(generator=generator, args=args)
+        source = GeneratorDataSource(generator=generator, args=args, shard_aware=shard_aware)
         return Dataset(_source=source)
 
     @staticmethod
@@ -143,6 +179,41 @@ class Dataset:
         source = TensorsDataSource(tensors=tensors)
         return Dataset(_source=source)
 
+    @staticmethod
+    def from_indexable(data):
+        """Reads the elements of `data` by their index, `data` has `__len__` and `__getitem__`, e.g. a map-style
+        dataset of PyTorch.
+
+        If `data` has `__getitems__`, it is given a list of indices and returns their elements, so many elements are
+        read at once. Shards and skipped elements are taken by their indices, the other elements are not read.
+        """
+        from ._sources import IndexableDataSource
+
+        assert hasattr(data, '__len__') and hasattr(data, '__getitem__'), \
+            'data: Must have `__len__` and `__getitem__`'
+
+        source = IndexableDataSource(data=data)
+        return Dataset(_source=source)
+
+    @staticmethod
+    def from_record_files(paths):
+        """Reads the records of the files written by `RecordWriter`, file by file.
+
+        Files are mapped into memory and the arrays and tensors of uncompressed records are views of the mapping,
+        no copy is made. Every file has an index of its records, a shard skips the records of the other shards
+        without reading them.
+        """
+        from ._sources import RecordFilesDataSource
+
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+
+        assert isinstance(paths, (list, tuple)) and all(isinstance(p, (str, os.PathLike)) for p in paths), \
+            'paths: Must be a path or a list of paths'
+
+        source = RecordFilesDataSource(paths=[os.fspath(p) for p in paths])
+        return Dataset(_source=source)
+
     @staticmethod
     def concatenate(*dataset_args, datasets=None, auto_prefetch=False):
         from ._sources import ConcatenateDataSource
@@ -206,6 +277,12 @@ class Dataset:
     # operations
 
     def batch(self, batch_size, *, drop_last=True):
+        """Stacks `batch_size` consecutive elements into a batch.
+
+        The batches of `from_tensor_slices` over arrays and tensors are made by a single slice of each of them, no
+        element is read on its own. Those of consecutive elements are views, which share their memory with the
+        sliced arrays and tensors.
+        """
         from ._ops import BatchDataOperation
 
         assert isinstance(batch_size, int), 'batch_size: must be an integer'
@@ -244,31 +321,172 @@ class Dataset:
 
         return Dataset(_source=op)
 
-    def map(self, map_func, num_parallel_calls=None, ordered=False, ignore_errors=False):
-        from ._ops import MapDataOperation
+    def map(self, map_func, num_parallel_calls=None, ordered=False, ignore_errors=False, executor=None, pool=None,
+            chunk_size=None, worker_init_fn=None, timeout=None, on_timeout='error'):
+        """Maps the elements with `map_func`, `map_func` may return a `Dataset`, whose elements are flattened.
+
+        If `worker_init_fn` is given, it is called once per worker and its result is passed to `map_func` as the first
+        argument, it is reused by all epochs. Maps which run in the parent process share one state. Without it, a map
+        on a `pool` with a `worker_init_fn` gets the state of the pool instead.
+
+        With a `timeout`, a sample of a process map, which has produced no result in `timeout` seconds since its
+        worker started it, is skipped, raises `TimeoutError` (unless errors are ignored) or is run once more by another
+        worker, whose result is taken if it comes first, according to `on_timeout` - 'skip', 'error' or 'retry'.
+        A retried sample, which times out again, raises `TimeoutError`. Samples are then sent one at a time, only to
+        workers of the pool which have no other sample of the map, so `chunk_size` can't be given. A timed out sample
+        still occupies its worker until `map_func` returns.
+        """
+        from ._ops import MapDataOperation, ProcessPool
 
         assert callable(map_func), 'map_func: Must be callable'
         assert num_parallel_calls is None or isinstance(num_parallel_calls, int), \
             'num_parallel_calls: Must be None or integer'
+        assert executor in (None, 'serial', 'async', 'thread', 'process'), \
+            "executor: Must be None, 'serial', 'async', 'thread' or 'process'"
+        assert executor != 'thread' or not asyncio.iscoroutinefunction(map_func), \
+            "map_func: A coroutine function can not run in the 'thread' executor"
+        assert executor != 'async' or asyncio.iscoroutinefunction(map_func), \
+            "map_func: Must be a coroutine function to run in the 'async' executor"
+        assert pool is None or isinstance(pool, ProcessPool), 'pool: Must be None or a ProcessPool'
+        assert pool is None or executor in (None, 'process'), \
+            "pool: Can be used only with the 'process' executor"
+        assert chunk_size is None or (isinstance(chunk_size, int) and chunk_size > 0), \
+            'chunk_size: Must be None or a positive integer'
+        assert worker_init_fn is None or callable(worker_init_fn), 'worker_init_fn: Must be None or callable'
+        assert timeout is None or (isinstance(timeout, (int, float)) and timeout > 0), \
+            'timeout: Must be None or a positive number'
+        assert timeout is None or executor in (None, 'process'), \
+            "timeout: Can be used only with the 'process' executor"
+        assert timeout is None or chunk_size is None, 'timeout: Can not be used with chunk_size'
+        assert on_timeout in ('error', 'skip', 'retry'), "on_timeout: Must be 'error', 'skip' or 'retry'"
+
+        if pool is not None or timeout is not None:
+            executor = 'process'
+
+        if executor is None:
+            if not num_parallel_calls:
+                executor = 'serial'
+            elif asyncio.iscoroutinefunction(map_func):
+                executor = 'async'
+            else:
+                executor = 'process'
 
         if num_parallel_calls is None:
-            num_parallel_calls = 0
+            if executor == 'serial':
+                num_parallel_calls = 0
+            else:
+                num_parallel_calls = pool.n_workers if pool is not None else os.cpu_count()
         elif num_parallel_calls < 0:
             num_parallel_calls = os.cpu_count()
 
+        assert timeout is None or num_parallel_calls > 0, 'timeout: Can be used only with a parallel map'
+
         op = MapDataOperation(source=self.__source, map_func=map_func,
                               num_parallel_calls=num_parallel_calls,
-                              ordered=ordered, ignore_errors=ignore_errors)
+                              ordered=ordered, ignore_errors=ignore_errors, executor=executor,
+                              pool=pool, chunk_size=chunk_size, worker_init_fn=worker_init_fn,
+                              timeout=timeout, on_timeout=on_timeout)
+
+        return Dataset(_source=op)
+
+    def shard(self, num_shards, index):
+        """Keeps every `num_shards`-th element of the dataset starting from `index`.
+
+        A dataset read by index, e.g. `from_tensor_slices` of arrays, reads only the elements of the shard, otherwise
+        the elements of the other shards are read and dropped.
+        """
+        from ._ops import ShardDataOperation
 
+        assert isinstance(num_shards, int) and num_shards > 0, 'num_shards: must be a positive integer'
+        assert isinstance(index, int) and 0 <= index < num_shards, 'index: must be in [0, num_shards)'
+
+        op = ShardDataOperation(source=self.__source, num_shards=num_shards, index=index)
         return Dataset(_source=op)
 
-    def shuffle(self, buffer_size, seed=None):
-        from ._ops import ShuffleDataOperation
+    def shard_parallel(self, num_shards=None, *, pool=None):
+        """Runs a replica of the whole pipeline per shard in the worker processes, outputs are merged as they come.
+
+        The sources of every replica yield only the elements of its shard, the replicas together yield all elements.
+        Slices of tensors are split between the shards without being read. A `from_generator` source is split by
+        skipping the elements of the other shards, so every replica runs the whole generator, unless it is created
+        with `shard_aware=True` and yields only the elements of the shard it is given.
+        """
+        from ._ops import ProcessPool, SourceShardDataOperation
+
+        assert num_shards is None or (isinstance(num_shards, int) and num_shards > 0), \
+            'num_shards: Must be None or a positive integer'
+        assert pool is None or isinstance(pool, ProcessPool), 'pool: Must be None or a ProcessPool'
+
+        if num_shards is None:
+            num_shards = pool.n_workers if pool is not None else os.cpu_count()
+
+        source = self.__source
+
+        def make_shard(*args):
+            # the state of the pool comes first, if it has a `worker_init_fn`
+            return Dataset(_source=SourceShardDataOperation(source=source, num_shards=num_shards, index=args[-1]))
+
+        ds = Dataset.from_tensor_slices(list(range(num_shards)))
+        return ds.map(make_shard, num_parallel_calls=num_shards, executor='process', pool=pool, chunk_size=1)
+
+    def skip(self, count):
+        """Skips the first `count` elements, in a shard the first `count` elements of the shard.
+
+        The elements of a source read by index, e.g. `from_tensor_slices` of arrays, are skipped without reading them.
+        """
+        from ._ops import SkipDataOperation
+
+        assert isinstance(count, int) and count >= 0, 'count: must be a non-negative integer'
+
+        op = SkipDataOperation(source=self.__source, count=count)
+        return Dataset(_source=op)
+
+    def shuffle(self, buffer_size=None, seed=None, *, reshuffle_each_iteration=True, memory_budget=None,
+                spill_directory=None):
+        """Shuffles the elements through a buffer of `buffer_size` elements, or, if it is None, with a permutation of
+        all elements of a source read by index, e.g. `from_tensor_slices` of arrays.
+
+        The buffer returns a random one of its elements and puts the next element into its place. The permutation is
+        computed block by block as the elements are read, no element and no array of all indices is kept.
+
+        With `memory_budget`, a number of bytes, all elements are shuffled, e.g. of a dataset, whose elements do not
+        fit into memory. They are spilled into temporary bucket files in `spill_directory`, or in the default
+        temporary directory, and the buckets are read one at a time, about `memory_budget` bytes each. The first
+        element is returned once all elements of the pass have been spilled.
+
+        Every pass, e.g. every epoch, has another order, unless `reshuffle_each_iteration` is False. The order of
+        the `i`-th pass depends only on `seed` and `i`, so it is reproducible with `seed`.
+        """
+        from ._ops import ExternalShuffleDataOperation, PermutationShuffleDataOperation, ShuffleDataOperation
+        from ._sources import is_random_access
+
+        assert isinstance(reshuffle_each_iteration, bool), 'reshuffle_each_iteration: must be a boolean'
+
+        if memory_budget is not None:
+            assert buffer_size is None, 'buffer_size: Must be None with memory_budget'
+            assert isinstance(memory_budget, int), 'memory_budget: must be an integer'
+            assert memory_budget > 0, 'memory_budget: must be greater than 0'
+
+            op = ExternalShuffleDataOperation(source=self.__source, memory_budget=memory_budget,
+                                              directory=spill_directory, seed=seed,
+                                              reshuffle_each_iteration=reshuffle_each_iteration)
+            return Dataset(_source=op)
+
+        assert spill_directory is None, 'spill_directory: Must be None without memory_budget'
+
+        if buffer_size is None:
+            assert is_random_access(self.__source), \
+                'buffer_size: Must be an integer for a dataset, which is not read by index'
+
+            op = PermutationShuffleDataOperation(source=self.__source, seed=seed,
+                                                 reshuffle_each_iteration=reshuffle_each_iteration)
+            return Dataset(_source=op)
 
         assert isinstance(buffer_size, int), 'buffer_size: must be an integer'
         assert buffer_size > 1, 'buffer_size: must be greater than 1'
 
-        op = ShuffleDataOperation(source=self.__source, buffer_size=buffer_size, seed=seed)
+        op = ShuffleDataOperation(source=self.__source, buffer_size=buffer_size, seed=seed,
+                                  reshuffle_each_iteration=reshuffle_each_iteration)
         return Dataset(_source=op)
 
     def unbatch(self):
@@ -307,8 +525,65 @@ class Dataset:
         op = PrefetchDataOperation(source=self.__source, buffer_size=size)
         return Dataset(_source=op)
 
-    # def repeat(self, times=None):
-    #     pass
+    def cache(self, path=None):
+        """Caches the elements of the dataset, in memory if `path` is None, otherwise in a file at `path`.
+
+        The first complete pass records the elements and the later passes replay them without running the pipeline
+        above. A pass, which is not complete, is not recorded. Passes started while the elements are being recorded,
+        e.g. the next epoch of `repeat`, wait for the recording. The file is written next to `path` and moved there
+        once the pass is complete, so it is reused by other datasets and processes with the same `path`. In a shard,
+        the elements are cached per shard and the shard is appended to `path`.
+        """
+        from ._ops import CacheDataOperation
+
+        assert path is None or isinstance(path, (str, os.PathLike)), 'path: Must be None or a path'
+
+        op = CacheDataOperation(source=self.__source, path=None if path is None else os.fspath(path))
+        return Dataset(_source=op)
+
+    def snapshot(self, path, *, compression=None, num_writers=1, num_parallel_reads=None, shuffle_files=False,
+                 seed=None):
+        """Materializes the elements of the dataset into files under `path`, which are read instead of running the
+        pipeline above by later passes, datasets and jobs with the same pipeline.
+
+        The snapshot of a pipeline is kept in a directory named by the fingerprint of its definition: the functions'
+        code, constants and closures, the arguments of the operations and the contents of arrays and tensors. The
+        globals used by the functions are identified only by their names. Elements are written by `num_writers`
+        threads into their own files, compressed by `compression`, 'zlib' or 'lzma', if it is not None. In a shard,
+        every shard writes its own files, the snapshot is complete once all shards have been written.
+
+        A complete snapshot is read from all its files in turn, which keeps the order of the elements of a shard,
+        `num_parallel_reads` threads decode the next elements, every CPU by default. Files are the unit of sharding,
+        a shard reads every `num_shards`-th file, and of shuffling, `shuffle_files` takes them in a random order every
+        pass, which is reproducible with `seed`.
+        """
+        from ._ops import SnapshotDataOperation
+
+        assert isinstance(path, (str, os.PathLike)), 'path: Must be a path'
+        assert compression in (None, 'zlib', 'lzma'), "compression: Must be None, 'zlib' or 'lzma'"
+        assert isinstance(num_writers, int) and num_writers > 0, 'num_writers: must be a positive integer'
+        assert num_parallel_reads is None or (isinstance(num_parallel_reads, int) and num_parallel_reads > 0), \
+            'num_parallel_reads: Must be None or a positive integer'
+        assert isinstance(shuffle_files, bool), 'shuffle_files: must be a boolean'
+
+        op = SnapshotDataOperation(source=self.__source, path=os.fspath(path), compression=compression,
+                                   num_writers=num_writers, num_parallel_reads=num_parallel_reads,
+                                   shuffle_files=shuffle_files, seed=seed)
+        return Dataset(_source=op)
+
+    def repeat(self, count=None):
+        """Repeats the dataset `count` times, forever if it is None.
+
+        The next epoch is started together with the current one, so the parallel maps and prefetches of the pipeline
+        keep working across the epoch boundary and its first elements are ready once the current epoch ends.
+        Repeating stops after an epoch without elements.
+        """
+        from ._ops import RepeatDataOperation
+
+        assert count is None or (isinstance(count, int) and count >= 0), 'count: Must be None or a non-negative integer'
+
+        op = RepeatDataOperation(source=self.__source, count=count)
+        return Dataset(_source=op)
 
     #
     #
@@ -334,4 +609,9 @@ class Dataset:
         return _DatasetAsyncIterator(session_id, source)
 
     def __iter__(self):
-        return _DatasetSyncIterator(self.__aiter__())
+        import uuid
+
+        session_id = uuid.uuid4().hex
+
+        # the loop thread's buffer already decouples the pipeline from the consumer, no extra prefetch is needed
+        return _DatasetSyncIterator(_DatasetAsyncIterator(session_id, self.__source))
@@ -0,0 +1,146 @@
+import concurrent.futures
+import hashlib
+import struct
+import threading
+import types
+
+try:
+    import numpy as np
+except (ImportError, ModuleNotFoundError):
+    np = None
+
+try:
+    import torch
+except (ImportError, ModuleNotFoundError):
+    torch = None
+
+_SCALARS = (type(None), bool, int, float, complex, str, bytes, type(Ellipsis))
+# resources of a running pipeline, not a part of its definition
+_OPAQUE = (type(threading.Lock()), type(threading.RLock()), threading.Condition, threading.Event,
+           concurrent.futures.Future, concurrent.futures.Executor)
+
+
+class _Hasher:
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        # objects seen so far, a second visit, e.g. a cycle, is hashed as a reference to the first one
+        self._memo = {}
+        self._keep = []
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def _token(self, tag, data=b''):
+        if isinstance(data, str):
+            data = data.encode('utf-8', 'surrogatepass')
+        self._hash.update(tag.encode() + struct.pack('<Q', len(data)) + data)
+
+    def _sorted(self, objs):
+        # the order of sets is not stable between processes, their items are ordered by their own digests
+        digests = []
+        for obj in objs:
+            hasher = _Hasher()
+            hasher.update(obj)
+            digests.append(hasher.hexdigest())
+        return sorted(digests)
+
+    def _name(self, obj):
+        return f'{getattr(obj, "__module__", None)}.{getattr(obj, "__qualname__", getattr(obj, "__name__", ""))}'
+
+    def _update_array(self, dtype, shape, data):
+        self._token('array', f'{dtype}{shape}')
+        self._hash.update(data)
+
+    def update(self, obj):
+        if isinstance(obj, _SCALARS):
+            self._token(type(obj).__name__, repr(obj))
+            return
+
+        if id(obj) in self._memo:
+            self._token('ref', str(self._memo[id(obj)]))
+            return
+
+        self._memo[id(obj)] = len(self._memo)
+        self._keep.append(obj)
+
+        if isinstance(obj, (list, tuple)):
+            self._token(type(obj).__name__, str(len(obj)))
+            for item in obj:
+                self.update(item)
+        elif isinstance(obj, dict):
+            self._token('dict', str(len(obj)))
+            for key, value in obj.items():
+                self.update(key)
+                self.update(value)
+        elif isinstance(obj, (set, frozenset)):
+            self._token('set', ''.join(self._sorted(obj)))
+        elif np is not None and isinstance(obj, np.ndarray):
+            array = np.ascontiguousarray(obj)
+            self._update_array(array.dtype, array.shape, array.reshape(-1).view(np.uint8))
+        elif torch is not None and isinstance(obj, torch.Tensor):
+            tensor = obj.detach().cpu().contiguous()
+            self._update_array(tensor.dtype, tuple(tensor.shape), tensor.reshape(-1).view(torch.uint8).numpy())
+        elif isinstance(obj, types.FunctionType):
+            self._token('function', self._name(obj))
+            self.update(obj.__code__)
+            self.update(obj.__defaults__)
+            self.update(obj.__kwdefaults__)
+            self.update(tuple(cell.cell_contents if _has_contents(cell) else None for cell in obj.__closure__ or ()))
+        elif isinstance(obj, types.CodeType):
+            # the location of the code is left out, moving a function does not change what it computes
+            self._token('code', obj.co_name)
+            self._hash.update(obj.co_code)
+            self.update(obj.co_consts)
+            self.update(obj.co_names)
+        elif isinstance(obj, (type, types.ModuleType, types.BuiltinFunctionType)):
+            self._token(type(obj).__name__, self._name(obj))
+        elif isinstance(obj, _OPAQUE) or _is_pool(obj):
+            self._token('opaque', self._name(type(obj)))
+        else:
+            self._update_object(obj)
+
+    def _update_object(self, obj):
+        self._token('object', self._name(type(obj)))
+        if type(obj).__module__.startswith(__package__ + '.') and hasattr(obj, '__dict__'):
+            # sources and operations, their attributes listed in `_FINGERPRINT_EXCLUDE` are caches of a running pipeline
+            exclude = getattr(type(obj), '_FINGERPRINT_EXCLUDE', ())
+            self.update({key: value for key, value in vars(obj).items() if key not in exclude})
+            return
+
+        try:
+            reduced = obj.__reduce_ex__(4)
+        except Exception:  # e.g. an object, which can not be pickled, only its type is known
+            return
+
+        if isinstance(reduced, str):  # a global
+            self._token('global', reduced)
+        else:
+            self.update(reduced)
+
+
+def _has_contents(cell):
+    try:
+        cell.cell_contents
+    except ValueError:  # an empty cell
+        return False
+    else:
+        return True
+
+
+def _is_pool(obj):
+    from ._ops import ProcessPool
+    from ._ops._map import _SharedDump
+
+    return isinstance(obj, (ProcessPool, _SharedDump))
+
+
+def fingerprint(obj):
+    """Digest of the definition of a pipeline, `obj` is a source or an operation.
+
+    Functions are identified by their code, constants, defaults and closures, classes, modules and the globals
+    functions use by their names. Arrays and tensors are identified by their contents. Pools, executors and other
+    resources of a running pipeline are left out.
+    """
+    hasher = _Hasher()
+    hasher.update(obj)
+    return hasher.hexdigest()
@@ -1,10 +1,16 @@
 
 from ._batch import BatchDataOperation
 from ._batch_padded import BatchPaddedDataOperation
+from ._cache import CacheDataOperation
 from ._collate import CollateDataOperation
+from ._external_shuffle import ExternalShuffleDataOperation
 from ._filter import FilterDataOperation
-from ._map import MapDataOperation
-from ._shuffle import ShuffleDataOperation
+from ._map import MapDataOperation, ProcessPool
+from ._repeat import RepeatDataOperation
+from ._shard import ShardDataOperation, SourceShardDataOperation
+from ._shuffle import PermutationShuffleDataOperation, ShuffleDataOperation
+from ._skip import SkipDataOperation
+from ._snapshot import SnapshotDataOperation
 from ._unbatch import UnBatchDataOperation
 from ._window import WindowDataOperation
 from ._window_padded import WindowPaddedDataOperation
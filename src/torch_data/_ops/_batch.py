@@ -1,6 +1,8 @@
 import aioitertools
 import copy
 
+from .._sources import is_random_access
+
 _STRATEGIES = []
 
 
@@ -160,6 +162,48 @@ class _BatchIterator:
             self._batch = None
 
 
+def _pad(column, batch_size):
+    # the missing samples of the last batch are zeros, as `batch_insert` makes them
+    if hasattr(column, 'new_zeros'):  # a tensor
+        batch = column.new_zeros((batch_size,) + tuple(column.shape[1:]))
+    else:
+        batch = np.zeros((batch_size,) + column.shape[1:], dtype=column.dtype)
+
+    batch[:len(column)] = column
+    return batch
+
+
+class _IndicesBatchIterator:
+    # every batch is gathered by the source at once, the batches of consecutive indices are views of its arrays
+    def __init__(self, session_id, source, indices, batch_size, drop_last):
+        self._session_id = session_id
+        self._source = source
+        self._indices = indices
+        self._batch_size = batch_size
+        self._drop_last = drop_last
+
+        self._pos = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        block = self._indices[self._pos:self._pos + self._batch_size]
+        self._pos += len(block)
+
+        if not len(block) or (len(block) < self._batch_size and self._drop_last):
+            raise StopAsyncIteration()
+
+        batch = self._source.gather_batch(block)
+        if len(block) < self._batch_size:
+            if isinstance(batch, tuple):
+                batch = tuple(_pad(column, self._batch_size) for column in batch)
+            else:
+                batch = _pad(batch, self._batch_size)
+
+        return batch
+
+
 class BatchDataOperation:
     def __init__(self, *, source, batch_size, drop_last):
         self._source = source
@@ -167,4 +211,9 @@ class BatchDataOperation:
         self._drop_last = drop_last
 
     def get_iter(self, session_id):
+        if is_random_access(self._source):
+            indices = self._source.indices()
+            if self._source.gather_batch(indices[:0]) is not None:
+                return _IndicesBatchIterator(session_id, self._source, indices, self._batch_size, self._drop_last)
+
         return _BatchIterator(self._source.get_iter(session_id), self._batch_size, self._drop_last)
@@ -0,0 +1,138 @@
+import aioitertools
+import asyncio
+import concurrent.futures
+import threading
+
+from .. import _records, _shard
+
+
+class _CacheIterator:
+    def __init__(self, session_id, op, shard):
+        self._session_id = session_id
+        self._op = op
+        self._shard = shard
+
+        self._iter = None
+        # while the upstream pipeline is recorded, the elements go to the list or the writer
+        self._recorded = None
+        self._writer = None
+        self._recording = None
+
+    def __del__(self):
+        self._abort()
+
+    def __aiter__(self):
+        return self
+
+    async def _start(self):
+        while True:
+            replay, recording, owned = self._op._begin(self._shard)
+            if replay is not None:
+                self._iter = aioitertools.iter(replay)
+                return
+
+            if owned:
+                break
+
+            # another iterator is recording, e.g. the previous epoch, its elements are replayed once it is complete
+            await asyncio.wrap_future(recording)
+
+        self._recording = recording
+        path = self._op._cache_path(self._shard)
+        if path is None:
+            self._recorded = []
+        else:
+            self._writer = _records.RecordWriter(path)
+
+        self._iter = _shard.get_iter(self._op._source, self._session_id, self._shard)
+
+    def _finish(self, complete):
+        if self._recording is None:
+            return
+
+        if complete:
+            if self._writer is not None:
+                self._writer.close()
+            else:
+                self._op._elements[self._shard] = self._recorded
+        elif self._writer is not None:
+            self._writer.abort()
+
+        self._writer = self._recorded = None
+        self._op._end(self._shard)
+        self._recording = None
+
+    def _abort(self):
+        # an interrupted pass is never taken as complete
+        if getattr(self, '_recording', None) is not None:
+            self._finish(False)
+
+    async def __anext__(self):
+        if self._iter is None:
+            await self._start()
+
+        try:
+            sample = await aioitertools.next(self._iter)
+        except StopAsyncIteration:
+            self._finish(True)
+            raise
+        except BaseException:
+            self._abort()
+            raise
+
+        if self._recording is not None:
+            if self._writer is not None:
+                self._writer.write(sample)
+            else:
+                self._recorded.append(sample)
+
+        return sample
+
+
+class CacheDataOperation:
+    _FINGERPRINT_EXCLUDE = ('_lock', '_elements', '_recordings')
+
+    def __init__(self, *, source, path=None):
+        self._source = source
+        self._path = path
+
+        self._lock = threading.Lock()
+        # elements of the complete in-memory passes and the passes being recorded, per shard
+        self._elements = {}
+        self._recordings = {}
+
+    def _cache_path(self, shard):
+        if self._path is None or shard is None:
+            return self._path
+
+        index, num_shards = shard
+        return f'{self._path}.shard-{index}-of-{num_shards}'
+
+    def _begin(self, shard):
+        # returns the elements to replay, otherwise the recording of the pass and whether the caller owns it
+        with self._lock:
+            elements = self._elements.get(shard)
+            if elements is not None:
+                return elements, None, False
+
+            path = self._cache_path(shard)
+            if path is not None and _records.is_complete(path):
+                return _records.RecordReader(path), None, False
+
+            recording = self._recordings.get(shard)
+            if recording is not None:
+                return None, recording, False
+
+            recording = self._recordings[shard] = concurrent.futures.Future()
+            return None, recording, True
+
+    def _end(self, shard):
+        with self._lock:
+            recording = self._recordings.pop(shard, None)
+
+        if recording is not None:
+            recording.set_result(None)
+
+    def get_iter(self, session_id):
+        # the upstream iterator is created only if the pass is recorded, in the shard of this iterator
+        return _CacheIterator(session_id, self, _shard.current_shard())
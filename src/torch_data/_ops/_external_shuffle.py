@@ -0,0 +1,138 @@
+import aioitertools
+import math
+import os
+import shutil
+import tempfile
+
+from .. import _records
+from ._shuffle import _EpochSeeds
+
+# buckets the elements are spilled into, a bucket larger than the memory budget is split again once it is read
+_NUM_BUCKETS = 64
+
+
+class _ExternalShuffleIterator:
+    # every element is written into a random bucket, then the buckets are read one at a time and each one is
+    # shuffled in memory, which is a uniformly random permutation of all elements
+    def __init__(self, source_iter, op, rand):
+        self._source_iter = source_iter
+        self._op = op
+        self._rand = rand
+
+        self._directory = None
+        self._next_bucket = 0
+        self._buckets = []
+        self._samples = []
+
+    def __del__(self):
+        self._close()
+
+    def __aiter__(self):
+        return self
+
+    def _close(self):
+        if getattr(self, '_directory', None) is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+    def _open_buckets(self, num_buckets):
+        writers = []
+        try:
+            for _ in range(num_buckets):
+                path = os.path.join(self._directory, f'{self._next_bucket:06d}.rec')
+                writers.append(_records.RecordWriter(path, sync=False))
+                self._next_bucket += 1
+        except BaseException:
+            for writer in writers:
+                writer.abort()
+            raise
+
+        return writers
+
+    def _close_buckets(self, writers):
+        try:
+            for writer in writers:
+                writer.close()
+        finally:
+            for writer in writers:
+                writer.abort()
+
+        # the buckets are read in a random order, the last one first
+        paths = [writer.path for writer in writers if len(writer)]
+        self._rand.shuffle(paths)
+        self._buckets.extend(paths)
+
+    async def _spill(self):
+        self._directory = tempfile.mkdtemp(prefix='torch-data-shuffle-', dir=self._op._directory)
+
+        writers = self._open_buckets(_NUM_BUCKETS)
+        try:
+            async for sample in aioitertools.iter(self._source_iter):
+                writers[self._rand.randrange(len(writers))].write(sample)
+        except BaseException:
+            for writer in writers:
+                writer.abort()
+            raise
+
+        self._source_iter = None
+        self._close_buckets(writers)
+
+    def _load(self, path):
+        size = os.path.getsize(path)
+        reader = _records.RecordReader(path)
+        # the mapping stays valid, the disk space is released with the last element of the bucket
+        os.unlink(path)
+
+        if size > self._op._memory_budget and len(reader) > 1:
+            writers = self._open_buckets(2 * math.ceil(size / self._op._memory_budget))
+            try:
+                for sample in reader:
+                    writers[self._rand.randrange(len(writers))].write(sample)
+            except BaseException:
+                for writer in writers:
+                    writer.abort()
+                raise
+
+            self._close_buckets(writers)
+            return
+
+        # the bucket is read in order, its arrays and tensors are views of the mapping, unless it is compressed
+        self._samples = list(reader)
+        self._rand.shuffle(self._samples)
+
+    async def __anext__(self):
+        try:
+            if self._directory is None:
+                if self._source_iter is None:
+                    raise StopAsyncIteration()
+                await self._spill()
+
+            while not self._samples:
+                if not self._buckets:
+                    raise StopAsyncIteration()
+                self._load(self._buckets.pop())
+
+            return self._samples.pop()
+        except BaseException:
+            self._close()
+            self._source_iter = None
+            raise
+
+
+class ExternalShuffleDataOperation:
+    """Shuffles all elements of the source, which are spilled into temporary bucket files.
+
+    Every element is written into one of the buckets at random, then the buckets are read in a random order. A bucket
+    is mapped into memory and shuffled, one which is larger than `memory_budget` bytes is split into smaller buckets
+    first, so about `memory_budget` bytes of elements are mapped at once. The buckets are made in a temporary
+    directory in `directory`, or in the default one, and removed as they are read.
+    """
+
+    def __init__(self, *, source, memory_budget, directory=None, seed=None, reshuffle_each_iteration=True):
+        self._source = source
+        self._memory_budget = memory_budget
+        self._directory = directory
+        self._seeds = _EpochSeeds(seed, reshuffle_each_iteration)
+
+    def get_iter(self, session_id):
+        return _ExternalShuffleIterator(self._source.get_iter(session_id), self, self._seeds.next_rand())
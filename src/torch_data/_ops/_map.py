@@ -1,11 +1,22 @@
 import asyncio
 import aioitertools
 import collections
+import contextlib
 import dill
+import functools
+import itertools
+import os
+import pickle
+import struct
 import sys
+import threading
+import time
 from contextlib import suppress
 import multiprocessing as mp
 
+from . import _transport
+from .._buffer import BufferClosed, ThreadSafeBuffer
+
 
 class _SerialIterator:
     def __init__(self, source, map_func, *, ignore_errors=False):
@@ -59,90 +70,365 @@ class _SerialIterator:
             raise StopAsyncIteration()
 
 
-_MP_CTX = mp.get_context('spawn')
+class _ConcurrentIterator:
+    # keeps up to `max_in_flight` calls of `map_func` running, the calls are started by `_submit`
+    _CALLS_PER_WORKER = 2
 
+    def __init__(self, source, map_func, n_workers, ordered, *, ignore_errors=False):
+        self._source_iter = source
+        self._map_func = map_func
+        self._max_in_flight = self._CALLS_PER_WORKER * n_workers
+        self._ordered = ordered
+        self._ignore_errors = ignore_errors
 
-class AsyncProcess:
-    _Task = collections.namedtuple('Task', ['coro', 'args', 'kwargs'])
+        self._in_flight = collections.deque()
+        self._result_ds = None
+
+    def __del__(self):
+        self._close()
 
-    class ProcessImpl(_MP_CTX.Process):
-        def __init__(self, queue, cancel_token):
-            super().__init__(daemon=True)
+    def _submit(self, sample):
+        raise NotImplementedError()
 
-            self._queue = queue
-            self._cancel_token = cancel_token
+    def _close(self):
+        for fut in self._in_flight:
+            with suppress(RuntimeError):
+                fut.cancel()
+        self._in_flight.clear()
 
-        def run(self):
-            from signal import SIGINT, SIGTERM
+    def __aiter__(self):
+        return self
 
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+    async def _next_done(self):
+        if self._ordered:
+            return self._in_flight.popleft()
+        else:
+            done, _ = await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+            fut = done.pop()
+            self._in_flight.remove(fut)
+            return fut
 
-            async def _wrapper(coro, *args, **kwargs):
+    async def __anext__(self):
+        from .. import _dataset
+
+        while True:
+            if self._result_ds is not None:
                 try:
-                    await coro(*args, **kwargs)
-                except (EOFError, BrokenPipeError, ConnectionResetError, FileNotFoundError):
-                    pass
-
-            async def _checker():
-                while not self._cancel_token.is_set():
-                    if self._queue.empty():
-                        await asyncio.sleep(0)
-                    else:
-                        try:
-                            task = dill.loads(self._queue.get())
-                            fut = loop.create_task(_wrapper(task.coro, *task.args, **task.kwargs))
-                            fut.add_done_callback(lambda f: self._queue.task_done())
-                        except (EOFError, mp.managers.RemoteError):
-                            self._cancel_token.set()
-                        except Exception:
-                            import traceback
-                            print(mp.current_process().name, 'got an error:\n', traceback.format_exc(),
-                                  file=sys.stderr, flush=True)
+                    return await aioitertools.next(self._result_ds)
+                except StopAsyncIteration:
+                    self._result_ds = None
 
-            def raise_keyboard():
-                raise KeyboardInterrupt()
+            while self._source_iter is not None and len(self._in_flight) < self._max_in_flight:
+                try:
+                    sample = await aioitertools.next(self._source_iter)
+                except StopAsyncIteration:
+                    self._source_iter = None
+                    break
+
+                if not isinstance(sample, tuple):
+                    sample = (sample,)
 
-            def raise_exit():
-                raise SystemExit()
+                self._in_flight.append(self._submit(sample))
 
-            loop.add_signal_handler(SIGINT, raise_keyboard)
-            loop.add_signal_handler(SIGTERM, raise_exit)
+            if not self._in_flight:
+                self._close()
+                raise StopAsyncIteration()
 
             try:
-                loop.run_until_complete(_wrapper(_checker))
-            except (KeyboardInterrupt, SystemExit):
-                pass
+                result = await (await self._next_done())
+            except Exception:
+                if not self._ignore_errors:
+                    raise
+                else:
+                    import traceback
+                    traceback.print_exc(file=sys.stderr)
+                    continue
+
+            if isinstance(result, _dataset.Dataset):
+                self._result_ds = aioitertools.iter(result)
+            else:
+                return result
+
+
+class _ThreadIterator(_ConcurrentIterator):
+    def __init__(self, source, map_func, n_workers, ordered, *, ignore_errors=False):
+        super().__init__(source, map_func, n_workers, ordered, ignore_errors=ignore_errors)
+
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix='torch-data-map')
+
+    def _submit(self, sample):
+        return asyncio.get_event_loop().run_in_executor(self._executor, self._map_func, *sample)
+
+    def _close(self):
+        super()._close()
+        self._executor.shutdown(wait=False)
+
+
+class _AsyncIterator(_ConcurrentIterator):
+    # the coroutines run as tasks of the pipeline's own loop, `n_workers` bounds how many of them are awaited at once
+    _CALLS_PER_WORKER = 1
+
+    def _submit(self, sample):
+        return asyncio.ensure_future(self._map_func(*sample))
+
+
+# every message of a worker pipe starts with the id of its channel and its kind, channel 0 carries the tasks,
+# a task is sent with the id of its channel, so the worker registers the channel before any message of it arrives
+_HEADER = struct.Struct('<qB')
+_DATA = 0
+_CLOSE = 1
+_TASK = 2
+_TASKS_CHANNEL = 0
+
+# channel ids are unique in the parent process, so channels of different workers can share one buffer
+_channel_ids = itertools.count(_TASKS_CHANNEL + 1)
+
+
+def _send(conn, lock, channel_id, kind, data=b''):
+    with lock:
+        conn.send_bytes(_HEADER.pack(channel_id, kind) + data)
+
+
+class _WorkerChannel:
+    def __init__(self, channel_id, conn, lock, channels):
+        self._id = channel_id
+        self._conn = conn
+        self._lock = lock
+        self._channels = channels
+        # registered once the task has arrived, it stays until the task ends, even if the parent has closed it
+        self._buffer = channels[channel_id]
+
+    @property
+    def closed(self):
+        # the parent has closed the channel, it doesn't wait for any more messages of the task
+        return self._buffer.closed
+
+    async def get(self):
+        try:
+            return await self._buffer.aget()
+        except BufferClosed:  # the parent has closed the channel and all of its messages have been received
+            return None
+
+    def drain(self):
+        # the messages left in a channel, which has been closed by the parent
+        messages = []
+        with suppress(BufferClosed):
+            while self._buffer.closed:
+                messages.append(self._buffer.get())
+
+        return messages
+
+    def send(self, data):
+        _send(self._conn, self._lock, self._id, _DATA, data)
+
+    def close(self):
+        self._channels.pop(self._id, None)
+        with suppress(OSError):
+            _send(self._conn, self._lock, self._id, _CLOSE)
+
+
+class Channel:
+    """The parent end of a channel to a task, which has been submitted to a worker process of the pool.
+
+    Messages of the task are put into the buffer given to `ProcessPool.submit` as `(channel_id, data)`,
+    `(channel_id, None)` marks the end of the task. Once the buffer is closed, messages go to `on_drop` instead.
+    """
+
+    def __init__(self, process, channel_id):
+        self.id = channel_id
+        self._process = process
+        self._closed = False
+
+    @property
+    def process(self):
+        # the worker process of the task, tasks of one process share its event loop
+        return self._process
+
+    def send(self, data):
+        self._process.send(self.id, data)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._process.close_channel(self.id)
+
+
+# in a worker process, the result of the `worker_init_fn` of its pool, which is passed to the maps without their own
+_NO_STATE = object()
+_pool_state = _NO_STATE
+
+# the sizes of the intra-op thread pools of OpenMP, BLAS and numexpr, the libraries read them once they are loaded
+_THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                    'NUMEXPR_NUM_THREADS')
+
+
+@contextlib.contextmanager
+def _thread_env(num_threads):
+    # spawned workers and the forkserver get the environment of the parent, they may load the libraries before
+    # `_worker_main` is called, e.g. while the main module is imported
+    if num_threads is None:
+        yield
+        return
+
+    saved = {name: os.environ.get(name) for name in _THREAD_ENV_VARS}
+    os.environ.update(dict.fromkeys(_THREAD_ENV_VARS, str(num_threads)))
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _worker_main(conn, preload, worker_init_fn, num_threads=None, cpus=None):
+    import importlib
+    from signal import SIGINT, SIGTERM
+
+    global _pool_state
+
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+
+    if num_threads is not None:
+        os.environ.update(dict.fromkeys(_THREAD_ENV_VARS, str(num_threads)))
+
+    for module in preload:
+        importlib.import_module(module)
+
+    # with `fork`, torch may have been loaded by the parent, it is loaded in a worker when a task needs it otherwise
+    if num_threads is not None and 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(num_threads)
+
+    if worker_init_fn is not None:
+        _pool_state = dill.loads(worker_init_fn)()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def _wrapper(coro, *args, **kwargs):
+        try:
+            await coro(*args, **kwargs)
+        except (EOFError, BrokenPipeError, ConnectionResetError, FileNotFoundError):
+            pass
+
+    send_lock = threading.Lock()
+    tasks_buffer = ThreadSafeBuffer()
+    channels = {}
+
+    def _reader():
+        # sleeps in a blocking `recv_bytes` and routes the messages of the pipe to their channels
+        try:
+            while True:
+                msg = conn.recv_bytes()
+                channel_id, kind = _HEADER.unpack_from(msg)
+                if kind == _TASK:
+                    if channel_id != _TASKS_CHANNEL:
+                        channels[channel_id] = ThreadSafeBuffer()
+                    tasks_buffer.put(msg[_HEADER.size:])
+                elif channel_id == _TASKS_CHANNEL:
+                    break
+                else:
+                    # messages of a channel, whose task has already ended, are dropped, the buffer of a running task
+                    # is removed by the task itself, so the messages it has not taken yet are still there
+                    if kind == _CLOSE:
+                        buffer = channels.get(channel_id)
+                        if buffer is not None:
+                            buffer.close()
+                    else:
+                        buffer = channels.get(channel_id)
+                        if buffer is not None:
+                            buffer.put(msg[_HEADER.size:])
+        except (EOFError, OSError):
+            pass
+        finally:
+            tasks_buffer.close()
+            for buffer in list(channels.values()):
+                buffer.close()
+
+    async def _run(task):
+        channel = None
+        args = task.args
+        if task.channel_id is not None:
+            channel = _WorkerChannel(task.channel_id, conn, send_lock, channels)
+            args = (channel,) + tuple(args)
+
+        try:
+            await _wrapper(task.coro, *args, **task.kwargs)
+        finally:
+            if channel is not None:
+                channel.close()
+
+    async def _checker():
+        threading.Thread(target=_reader, daemon=True).start()
+
+        while True:
+            try:
+                task = await tasks_buffer.aget()
+            except BufferClosed:
+                break
+
+            try:
+                loop.create_task(_run(dill.loads(task)))
             except Exception:
                 import traceback
-                traceback.print_exc()
-            finally:
-                tasks = []
-                for task in asyncio.all_tasks(loop):
-                    task.cancel()
-                    tasks.append(task)
+                print(mp.current_process().name, 'got an error:\n', traceback.format_exc(),
+                      file=sys.stderr, flush=True)
+
+    def raise_keyboard():
+        raise KeyboardInterrupt()
+
+    def raise_exit():
+        raise SystemExit()
+
+    loop.add_signal_handler(SIGINT, raise_keyboard)
+    loop.add_signal_handler(SIGTERM, raise_exit)
+
+    try:
+        loop.run_until_complete(_wrapper(_checker))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    except Exception:
+        import traceback
+        traceback.print_exc()
+    finally:
+        tasks = []
+        for task in asyncio.all_tasks(loop):
+            task.cancel()
+            tasks.append(task)
+
+        # print(mp.current_process().name, 'tasks to close', len(tasks), file=sys.stderr, flush=True)
+        with suppress(asyncio.exceptions.CancelledError):
+            loop.run_until_complete(asyncio.gather(*tasks))
 
-                # print(mp.current_process().name, 'tasks to close', len(tasks), file=sys.stderr, flush=True)
-                with suppress(asyncio.exceptions.CancelledError):
-                    loop.run_until_complete(asyncio.gather(*tasks))
+        loop.stop()
+        loop.close()
 
-                loop.stop()
-                loop.close()
+
+class AsyncProcess:
+    _Task = collections.namedtuple('Task', ['coro', 'args', 'kwargs', 'channel_id'])
 
     @property
     def n_tasks(self):
-        if self._tasks_queue is None:
-            return 0
-        else:
-            return self._tasks_queue._unfinished_tasks.get_value()
+        return len(self._channels)
 
-    def __init__(self):
-        self._tasks_queue = _MP_CTX.JoinableQueue()
-        self._tasks_queue.cancel_join_thread()
-        self._cancel_token = _MP_CTX.Event()
+    @property
+    def alive(self):
+        return not self._stopped and self._process.is_alive()
+
+    def __init__(self, ctx, preload=(), worker_init_fn=None, num_threads=None, cpus=None):
+        self._conn, self._child_conn = ctx.Pipe()
+        self._send_lock = threading.Lock()
+        self._stopped = False
+
+        # channel id -> (buffer, on_drop)
+        self._channels = {}
 
-        self._process = AsyncProcess.ProcessImpl(self._tasks_queue, self._cancel_token)
-        # self._process.daemon = True
+        self._process = ctx.Process(target=_worker_main,
+                                    args=(self._child_conn, tuple(preload), worker_init_fn, num_threads, cpus),
+                                    daemon=True)
 
     def __del__(self):
         self.stop()
@@ -151,24 +437,67 @@ class AsyncProcess:
         self._process.join()
         self._process.close()
 
+    @staticmethod
+    def _read_loop(conn, channels):
+        # the reader owns the connection, it is closed once the worker has exited
+        try:
+            while True:
+                msg = conn.recv_bytes()
+                channel_id, kind = _HEADER.unpack_from(msg)
+                entry = channels.get(channel_id)
+                if entry is None:
+                    continue
+
+                buffer, on_drop = entry
+                if kind == _CLOSE:
+                    channels.pop(channel_id, None)
+                    with suppress(BufferClosed):
+                        buffer.put((channel_id, None))
+                else:
+                    try:
+                        buffer.put((channel_id, msg[_HEADER.size:]))
+                    except BufferClosed:
+                        if on_drop is not None:
+                            on_drop(msg[_HEADER.size:])
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+            for buffer, _ in list(channels.values()):
+                buffer.close()
+
     def start(self):
         self._process.start()
+        # the worker has its own copy, closing this one lets the reader see the end of the pipe
+        self._child_conn.close()
+
+        threading.Thread(target=AsyncProcess._read_loop, args=(self._conn, self._channels), daemon=True).start()
 
     def stop(self):
-        if self._cancel_token is not None:
-            self._cancel_token.set()
-            self._cancel_token = None
-        if self._tasks_queue is not None:
-            self._tasks_queue.close()
-            self._tasks_queue = None
+        if not self._stopped:
+            self._stopped = True
+            with suppress(OSError):
+                _send(self._conn, self._send_lock, _TASKS_CHANNEL, _CLOSE)
 
     def join(self, timeout=None):
         if self._process.is_alive():
             self._process.join(timeout)
 
-    def add_task(self, task, args=None, kwargs=None):
+    def open_channel(self, buffer, on_drop=None):
+        channel_id = next(_channel_ids)
+        self._channels[channel_id] = (buffer, on_drop)
+        return Channel(self, channel_id)
+
+    def send(self, channel_id, data):
+        _send(self._conn, self._send_lock, channel_id, _DATA, data)
+
+    def close_channel(self, channel_id):
+        with suppress(OSError):
+            _send(self._conn, self._send_lock, channel_id, _CLOSE)
+
+    def add_task(self, task, args=None, kwargs=None, channel=None):
         assert self._process.is_alive()
-        assert self._tasks_queue is not None
+        assert not self._stopped
         assert asyncio.iscoroutinefunction(task)
 
         if args is None:
@@ -177,35 +506,108 @@ class AsyncProcess:
         if kwargs is None:
             kwargs = dict()
 
-        task = AsyncProcess._Task(coro=task, args=args, kwargs=kwargs)
+        task = AsyncProcess._Task(coro=task, args=args, kwargs=kwargs,
+                                  channel_id=channel.id if channel is not None else None)
 
-        self._tasks_queue.put(dill.dumps(task))
+        _send(self._conn, self._send_lock, channel.id if channel is not None else _TASKS_CHANNEL, _TASK,
+              dill.dumps(task))
 
 
-class MetaSingleton(type):
-    _instances = {}
+class ProcessPool:
+    """A pool of worker processes, which run the tasks of parallel maps.
 
-    def __call__(cls, *args, **kwargs):
-        if not hasattr(cls, 'instance'):
-            cls.instance = super(MetaSingleton, cls).__call__(*args, **kwargs)
+    The pool persists across epochs and datasets until `shutdown` is called, it can be used as a context manager.
+    Workers are created with the `start_method` context of multiprocessing and import the `preload` modules before
+    they take any task, with `forkserver` the modules are imported once by the server. Then every worker calls
+    `worker_init_fn`, if it is given, its result is passed as the first argument to the functions of the maps on the
+    pool, which have no `worker_init_fn` of their own. Unless `lazy` is false, the workers are started by the first
+    submitted task.
 
-        return cls.instance
+    Every worker limits the intra-op thread pools of torch, OpenMP and BLAS to `num_threads`, by default to one
+    thread, so the workers don't oversubscribe the CPUs, None keeps the defaults of the libraries. With `cpu_affinity`,
+    the workers are pinned to CPUs, e.g. to leave the other ones to the training process. It is either a collection of
+    CPU ids shared by all workers, or a list of such collections, which are assigned to the workers in turn, by default
+    there is a worker per collection or per shared CPU.
+    """
 
+    _default = None
+    _default_lock = threading.Lock()
 
-class ProcessPool(metaclass=MetaSingleton):
-    def __init__(self):
-        self.ctx = _MP_CTX
-        self.manager = None
+    @classmethod
+    def default(cls):
+        """The pool with a worker per CPU, which is used by `Dataset.map` when no pool is given."""
+        with cls._default_lock:
+            if cls._default is None or cls._default.closed:
+                cls._default = cls()
 
-        self._pool = None
+            return cls._default
 
-        self._start()
+    def __init__(self, n_workers=None, *, start_method='spawn', preload=None, worker_init_fn=None, num_threads=1,
+                 cpu_affinity=None, lazy=True):
+        import atexit
+        import uuid
+
+        self._pool = None
+        self._lock = threading.Lock()
+        self.closed = False
+
+        assert n_workers is None or (isinstance(n_workers, int) and n_workers > 0), \
+            'n_workers: Must be None or a positive integer'
+        assert start_method in mp.get_all_start_methods(), \
+            f'start_method: Must be one of {mp.get_all_start_methods()}'
+        assert worker_init_fn is None or callable(worker_init_fn), 'worker_init_fn: Must be None or callable'
+        assert num_threads is None or (isinstance(num_threads, int) and num_threads > 0), \
+            'num_threads: Must be None or a positive integer'
+        assert cpu_affinity is None or hasattr(os, 'sched_setaffinity'), \
+            'cpu_affinity: Is not supported by the platform'
+
+        self.cpu_affinity = None
+        if cpu_affinity is not None:
+            cpu_affinity = list(cpu_affinity)
+            if all(isinstance(cpu, int) for cpu in cpu_affinity):
+                cpu_affinity = [cpu_affinity]
+            self.cpu_affinity = [frozenset(cpus) for cpus in cpu_affinity]
+
+            assert self.cpu_affinity and all(self.cpu_affinity), 'cpu_affinity: Must not be empty'
+            assert all(isinstance(cpu, int) and cpu >= 0 for cpus in self.cpu_affinity for cpu in cpus), \
+                'cpu_affinity: Must be a collection of CPU ids or a list of such collections'
+
+        if n_workers is None and self.cpu_affinity is not None:
+            n_workers = len(self.cpu_affinity) if len(self.cpu_affinity) > 1 else len(self.cpu_affinity[0])
+
+        self.ctx = mp.get_context(start_method)
+        self.n_workers = n_workers or os.cpu_count()
+        self.num_threads = num_threads
+        self.preload = tuple(preload or ())
+        self.worker_init_fn = worker_init_fn
+        self._worker_init_fn = dill.dumps(worker_init_fn) if worker_init_fn is not None else None
+
+        if start_method == 'forkserver' and self.preload:
+            self.ctx.set_forkserver_preload(list(self.preload))
+
+        # shared memory segments of the pool are named with this prefix, so the leftovers can be found
+        self.shm_prefix = f'torch-data-{uuid.uuid4().hex[:8]}-'
+        atexit.register(_transport.cleanup, self.shm_prefix)
+
+        if not lazy:
+            self.start()
 
     def __del__(self):
-        self._stop()
+        self.shutdown()
 
-    def submit(self, task, args=None, kwargs=None):
-        assert self._pool is not None, 'The Pool has been disposed'
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def submit(self, task, args=None, kwargs=None, *, buffer=None, on_drop=None):
+        """Runs the coroutine function `task` in the least busy worker.
+
+        If `buffer` is given, a channel to the task is opened and returned, the task gets its worker end as the
+        first positional argument. Messages which arrive after the buffer has been closed are passed to `on_drop`.
+        """
+        self.start()
 
         if args is None:
             args = tuple()
@@ -214,44 +616,238 @@ class ProcessPool(metaclass=MetaSingleton):
             kwargs = dict()
 
         process = min(self._pool, key=lambda x: x.n_tasks)
-        return process.add_task(task, args=args, kwargs=kwargs)
 
-    def _start(self):
-        if not self._pool:
-            self.manager = self.ctx.Manager()
+        channel = None
+        if buffer is not None:
+            channel = process.open_channel(buffer, on_drop)
 
-            import os
-            self._pool = [AsyncProcess() for _ in range(os.cpu_count())]
+        process.add_task(task, args=args, kwargs=kwargs, channel=channel)
+        return channel
+
+    def broadcast(self, task, args=None, kwargs=None):
+        """Runs the coroutine function `task` once in every running worker."""
+        # the dumps call it while being collected, which may happen with the lock held
+        for process in list(self._pool or ()):
+            if process.alive:
+                with suppress(OSError):
+                    process.add_task(task, args=args, kwargs=kwargs)
+
+    def start(self):
+        with self._lock:
+            assert not self.closed, 'The Pool has been shut down'
 
-            for t in self._pool:
-                t.start()
+            if not self._pool:
+                self._pool = [AsyncProcess(self.ctx, self.preload, self._worker_init_fn, self.num_threads,
+                                           self._worker_cpus(i))
+                              for i in range(self.n_workers)]
 
-    def _stop(self):
-        if self._pool:
-            for t in self._pool:
-                t.stop()
+                with _thread_env(self.num_threads):
+                    for t in self._pool:
+                        t.start()
 
-            # dt = 1 / len(self._pool)
-            for t in self._pool:
-                t.join()
+    def _worker_cpus(self, index):
+        if self.cpu_affinity is None:
+            return None
 
-            self._pool.clear()
+        return self.cpu_affinity[index % len(self.cpu_affinity)]
 
-            self.manager.shutdown()
+    def shutdown(self):
+        with self._lock:
+            self.closed = True
+
+            if self._pool:
+                for t in self._pool:
+                    t.stop()
+
+                for t in self._pool:
+                    t.join()
+
+                self._pool.clear()
+
+                _transport.cleanup(self.shm_prefix)
 
             self._pool = None
 
 
+class _SharedDump:
+    # a function for the workers of a pool, the arrays and tensors it captures are put into shared memory once and
+    # every worker maps them copy-on-write instead of unpickling its own copy
+
+    def __init__(self, obj, pool):
+        self.shm_prefix = pool.shm_prefix
+        # not a weak reference, the collector clears those of a garbage cycle before it calls `__del__`
+        self._pool = pool
+        self._transport = _transport.SharedMemoryTransport(pool.shm_prefix)
+        self.data = self._transport.pack(obj, shared=True)
+
+    def __del__(self):
+        # the workers drop what they have loaded from the dump, so its shared memory is released with the last of them
+        self._pool.broadcast(_evict_dump, args=(self.data,))
+
+        self._transport.discard(self.data)
+
+
+class _WorkerCache:
+    # workers of a persistent pool get the same dumps every epoch, what is loaded from a dump is kept until the parent
+    # discards the dump or it is the least recently used of more than `maxsize` entries
+
+    def __init__(self, load, maxsize):
+        self._load = load
+        self._maxsize = maxsize
+        self._entries = collections.OrderedDict()
+
+    def __call__(self, dump):
+        if dump in self._entries:
+            self._entries.move_to_end(dump)
+            return self._entries[dump]
+
+        value = self._entries[dump] = self._load(dump)
+        if len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+        return value
+
+    def evict(self, dump):
+        self._entries.pop(dump, None)
+
+
+_load_map_func = _WorkerCache(_transport.SharedMemoryTransport.unpack, maxsize=32)
+# the state is created once per worker and reused by all epochs of the map
+_load_worker_state = _WorkerCache(lambda dump: _transport.SharedMemoryTransport.unpack(dump)(), maxsize=8)
+
+
+async def _evict_dump(dump):
+    _load_map_func.evict(dump)
+    _load_worker_state.evict(dump)
+
+
+class _LazyWorkerState:
+    # the state of the maps which run in the parent process, the process is their only worker
+    _none = object()
+
+    def __init__(self, worker_init_fn):
+        self._worker_init_fn = worker_init_fn
+        self._lock = threading.Lock()
+        self._state = self._none
+
+    def __call__(self):
+        if self._state is self._none:
+            with self._lock:
+                if self._state is self._none:
+                    self._state = self._worker_init_fn()
+
+        return self._state
+
+
+def _with_worker_state(map_func, get_state):
+    # `map_func` gets the state of its worker as the first argument
+    if asyncio.iscoroutinefunction(map_func):
+        async def _bound(*args):
+            return await map_func(get_state(), *args)
+    else:
+        def _bound(*args):
+            return map_func(get_state(), *args)
+
+    return _bound
+
+
+# adaptive chunks of a parallel map are sized to take about this much compute time in a worker
+_CHUNK_TIME = 0.01
+_MAX_CHUNK_SIZE = 256
+
+# results of a nested dataset are streamed in messages of this many items, up to `_STREAM_WINDOW` of them unconsumed
+_STREAM_CHUNK = 64
+_STREAM_WINDOW = 4
+
+# besides chunks of samples, the parent sends these to a map task, they never collide with a pickled chunk
+_END_OF_TASKS = b'\x00'
+_ACK = b'\x01'
+
+# with a timeout, a map task reports the index of every sample it starts to process, prefixed with this
+_STARTED = b'\x02'
+_SAMPLE_IDX = struct.Struct('<q')
+
+
+def _discard_output(transport, data):
+    # releases the shared memory of a message of a map task, which is never going to be consumed
+    if not data.startswith(_STARTED):
+        transport.discard(data)
+
+
+class _OrderedResults:
+    # results of a sample are returned once all the results of the preceding samples have been returned
+
+    def __init__(self):
+        self._next_idx = 0
+        self._pending = {}
+
+    def extend(self, entries):
+        for entry in entries:
+            queue = self._pending.get(entry[0])
+            if queue is None:
+                queue = self._pending[entry[0]] = collections.deque()
+            queue.append(entry)
+
+    def pop(self):
+        queue = self._pending.get(self._next_idx)
+        if not queue:
+            return None
+
+        entry = queue.popleft()
+        if entry[1]:  # the last result of the sample
+            del self._pending[self._next_idx]
+            self._next_idx += 1
+
+        return entry
+
+
+class _UnorderedResults:
+    def __init__(self):
+        self._queue = collections.deque()
+
+    def extend(self, entries):
+        self._queue.extend(entries)
+
+    def pop(self):
+        return self._queue.popleft() if self._queue else None
+
+
+class _PendingSample:
+    # a sample of a parallel map with a timeout, which has been sent to a worker, but has not been finished yet
+    __slots__ = ('sample', 'deadline', 'retried', 'owner')
+
+    def __init__(self, sample):
+        self.sample = sample
+        self.deadline = float('inf')
+        self.retried = False
+        # the channel, whose results of the sample are returned
+        self.owner = None
+
+
 class _ParallelIterator:
     @staticmethod
-    async def _parallel_process(map_func, input_queue, output_queue, cancel_token):
-        import gc
+    async def _parallel_process(channel, map_func, worker_init_fn, shm_prefix, report_start=False):
         import multiprocessing
         from .. import _dataset
 
-        _map_func = dill.loads(map_func)
+        transport = _transport.SharedMemoryTransport(shm_prefix)
 
-        if asyncio.iscoroutinefunction(map_func):
+        _map_func = _load_map_func(map_func)
+
+        worker_state = _pool_state
+        if worker_init_fn is not None:
+            try:
+                worker_state = _load_worker_state(worker_init_fn)
+            except Exception:
+                import traceback
+                print(multiprocessing.current_process().name, 'got an error in worker_init_fn:\n',
+                      traceback.format_exc(), file=sys.stderr, flush=True)
+                raise
+
+        if worker_state is not _NO_STATE:
+            _map_func = _with_worker_state(_map_func, lambda: worker_state)
+
+        if asyncio.iscoroutinefunction(_map_func):
             map_func = _map_func
         else:
             async def _wrapper(*args, **kwargs):
@@ -259,36 +855,61 @@ class _ParallelIterator:
 
             map_func = _wrapper
 
-        async def send_result(idx, result):
-            while output_queue.full():
-                await asyncio.sleep(0)
-            else:
-                output_queue.put(dill.dumps((idx, True, result)))
+        tasks = collections.deque()
+        state = {'credits': _STREAM_WINDOW, 'end': False}
 
-        async def send_results(idx, results):
-            results = [
-                (idx, False, result)
-                for result in results
-            ]
-            results.append((idx, True, (False, None)))
+        async def receive():
+            # returns false once the parent has closed the channel
+            msg = await channel.get()
+            if msg is None:
+                return False
 
-            while output_queue.full():
-                await asyncio.sleep(0)
+            if msg == _END_OF_TASKS:
+                state['end'] = True
+            elif msg == _ACK:
+                state['credits'] += 1
             else:
-                output_queue.put(dill.dumps(results))
+                tasks.append(msg)
 
-        while not cancel_token.is_set():
-            if input_queue.empty():
-                await asyncio.sleep(0)
-            else:
+            return True
+
+        try:
+            while True:
+                while not tasks and not state['end']:
+                    if not await receive():
+                        return
+
+                if not tasks:  # all samples have been sent
+                    break
+
+                if channel.closed:  # the parent doesn't wait for the results anymore
+                    return
+
+                # the results of a chunk go back in one message, the last entry of every sample is flagged
+                results = []
+                started = time.perf_counter()
+                indices, samples = pickle.loads(tasks.popleft())
                 try:
-                    idx, sample = dill.loads(input_queue.get())
+                    samples = transport.unpack(samples)
+                except Exception:
+                    import traceback
+                    print(multiprocessing.current_process().name, f'got an error unpickling samples {indices}:\n',
+                          traceback.format_exc(), file=sys.stderr, flush=True)
+
+                    error = traceback.format_exc()
+                    results = [(idx, True, (False, RuntimeError(f'Sample #{idx} can not be unpickled:\n' + error)))
+                               for idx in indices]
+                    channel.send(transport.pack((results, (len(indices), time.perf_counter() - started))))
+                    continue
+
+                for idx, sample in zip(indices, samples):
+                    if report_start:
+                        channel.send(_STARTED + _SAMPLE_IDX.pack(idx))
 
                     try:
                         result = await map_func(*sample)
                         result = (True, result)
                     except Exception:
-                        import sys
                         import traceback
                         print(multiprocessing.current_process().name, f'got an error for sample #{idx}:\n',
                               traceback.format_exc(),
@@ -297,127 +918,357 @@ class _ParallelIterator:
                         result = (False, RuntimeError(f'Sample #{idx}:\n' + traceback.format_exc()))
 
                     if isinstance(result[1], _dataset.Dataset):
-                        try:
-                            results = []
-                            async for item in result[1]:
-                                results.append((True, item))
-
-                            await send_results(idx, results)
-                        finally:
-                            result = None
-                            gc.collect()
+                        # nested datasets are streamed, each message has to be consumed before the window is exceeded
+                        async for item in result[1]:
+                            results.append((idx, False, (True, item)))
+
+                            if len(results) >= _STREAM_CHUNK:
+                                while not state['credits']:
+                                    if not await receive():
+                                        return
+
+                                state['credits'] -= 1
+                                channel.send(transport.pack((results, None)))
+                                results = []
+
+                        results.append((idx, True, (False, None)))
                     else:
-                        await send_result(idx, result)
-                finally:
-                    pass
+                        results.append((idx, True, result))
 
-    def __init__(self, session_id, source, map_func, n_workers, ordered, *, ignore_errors=False):
-        self._pool = ProcessPool()
+                channel.send(transport.pack((results, (len(samples), time.perf_counter() - started))))
+        finally:
+            # chunks which are never going to be processed, their shared memory is released
+            for msg in itertools.chain(tasks, channel.drain()):
+                if msg not in (_END_OF_TASKS, _ACK):
+                    transport.discard(pickle.loads(msg)[1])
 
-        self._stop_fetching = False
+    def __init__(self, session_id, source, map_func_dump, n_workers, ordered, *, pool, worker_init_fn_dump=None,
+                 chunk_size=None, timeout=None, on_timeout='error', ignore_errors=False):
+        self._pool = pool
+        # the shared memory of the functions has to stay until the workers have loaded them
+        self._dumps = (map_func_dump, worker_init_fn_dump)
 
         self._n_workers = n_workers
         self._source_iter = aioitertools.enumerate(source)
         self._ignore_errors = ignore_errors
 
-        map_func_dump = dill.dumps(map_func)
+        self._transport = _transport.SharedMemoryTransport(self._pool.shm_prefix)
 
-        # self._input_queue_n_tasks = _ParallelSession.manager.Semaphore(0)
+        # without a fixed size, chunks grow until they take about `_CHUNK_TIME` in a worker
+        self._adaptive = chunk_size is None
+        self._chunk_size = 1 if chunk_size is None else chunk_size
+        self._sample_time = None
 
-        self._input_queue = self._pool.manager.Queue(self._n_workers)
-        self._output_queue = self._pool.manager.Queue(2 * self._n_workers)
-        self._cancel_token = self._pool.manager.Event()
+        # with a timeout, a sample is timed from the moment its worker reports that it has started it, it is sent only
+        # to a worker process, which has no other sample of the map, so it doesn't queue behind a straggler
+        self._timeout = timeout
+        self._on_timeout = on_timeout
+        self._pending = {}
+        self._retries = collections.deque()
+        if timeout is not None:
+            self._adaptive = False
+            self._chunk_size = 1
 
-        self._fetch_next_idx = 0
+        self._end_sent = False
 
-        if ordered:
-            def put_strategy(fetch_next_idx, sample_idx):
-                return fetch_next_idx == sample_idx
-        else:
-            def put_strategy(fetch_next_idx, sample_idx):
-                return True
-
-        self._put_strategy = put_strategy
+        # results are `(sample idx, last result of the sample, (success, value))` entries
+        self._results = _OrderedResults() if ordered else _UnorderedResults()
 
+        # results of all workers arrive in one buffer, each worker has a direct pipe to the parent
+        self._output = ThreadSafeBuffer()
+        self._channels = {}
         for _ in range(n_workers):
-            self._pool.submit(
+            channel = self._pool.submit(
                 _ParallelIterator._parallel_process,
-                args=(map_func_dump, self._input_queue, self._output_queue, self._cancel_token)
+                args=(map_func_dump.data, worker_init_fn_dump and worker_init_fn_dump.data, self._pool.shm_prefix,
+                      timeout is not None),
+                buffer=self._output,
+                on_drop=functools.partial(_discard_output, self._transport)
             )
+            self._channels[channel.id] = channel
+
+        # samples sent to each channel whose results have not arrived yet
+        self._channel_samples = dict.fromkeys(self._channels, 0)
 
         self._samples_in_process = 0
-        self._result_bag = []
 
     def __del__(self):
-        if self._pool is not None:
-            try:
-                if self._cancel_token is not None:
-                    self._cancel_token.set()
-            except FileNotFoundError:
-                pass
+        for channel in self._channels.values():
+            channel.close()
+
+        # shared memory of the results which are never going to be consumed has to be released
+        self._output.close()
+        with suppress(BufferClosed):
+            while True:
+                _, result = self._output.get()
+                if result is not None:
+                    _discard_output(self._transport, result)
 
     def __aiter__(self):
         return self
 
-    async def __anext__(self):
-        while self._source_iter is not None or self._samples_in_process > 0:
-            if self._source_iter is not None and not self._input_queue.full():
+    @property
+    def _max_samples_in_process(self):
+        return max(4 * self._n_workers, 2 * self._n_workers * self._chunk_size)
+
+    def _update_chunk_size(self, n_samples, elapsed):
+        if not self._adaptive or not n_samples:
+            return
+
+        sample_time = elapsed / n_samples
+        if self._sample_time is None:
+            self._sample_time = sample_time
+        else:
+            self._sample_time = 0.8 * self._sample_time + 0.2 * sample_time
+
+        chunk_size = int(_CHUNK_TIME / self._sample_time) if self._sample_time > 0 else _MAX_CHUNK_SIZE
+        self._chunk_size = max(1, min(chunk_size, _MAX_CHUNK_SIZE))
+
+    def _idle_channel(self):
+        # a channel of a worker process, which has no sample of the map, synchronous map functions block the process
+        busy = {id(self._channels[channel_id].process) for channel_id, n in self._channel_samples.items() if n}
+        for channel_id, channel in self._channels.items():
+            if id(channel.process) not in busy:
+                return channel_id
+
+        return None
+
+    def _can_dispatch(self):
+        if self._timeout is not None and self._idle_channel() is None:
+            return False
+
+        if self._retries:
+            return True
+
+        # only whole chunks are dispatched, a chunk is sent once the results of one have been consumed
+        return self._source_iter is not None and \
+            self._samples_in_process + self._chunk_size <= self._max_samples_in_process
+
+    async def _dispatch(self):
+        chunk = []
+        if self._retries:
+            idx = self._retries.popleft()
+            pending = self._pending.get(idx)
+            if pending is not None:  # the sample may have been finished by its first run meanwhile
+                chunk.append((idx, pending.sample))
+        else:
+            while len(chunk) < self._chunk_size:
                 try:
                     idx, sample = await aioitertools.next(self._source_iter)
-                    if not isinstance(sample, tuple):
-                        sample = (sample,)
-
-                    self._input_queue.put(dill.dumps((idx, sample)))
-                    self._samples_in_process += 1
                 except StopAsyncIteration:
                     self._source_iter = None
+                    break
 
-            while not self._output_queue.empty():
-                result = dill.loads(self._output_queue.get())
-                if isinstance(result, list):
-                    self._result_bag = self._result_bag + result
-                else:
-                    self._result_bag.append(result)
+                if not isinstance(sample, tuple):
+                    sample = (sample,)
 
-            remove_list = []
-            try:
-                for i, (idx, next_flag, item) in enumerate(self._result_bag):
-                    if self._put_strategy(self._fetch_next_idx, idx):
-                        try:
-                            (flag, result) = item
-                            if flag:
-                                return result
-                            else:
-                                if not self._ignore_errors and isinstance(result, Exception):
-                                    raise result
-                        finally:
-                            if next_flag:
-                                self._fetch_next_idx += 1
-                                self._samples_in_process -= 1
-                            remove_list.append(i)
-            finally:
-                for i in reversed(remove_list):
-                    del self._result_bag[i]
-
-            await asyncio.sleep(0)
+                chunk.append((idx, sample))
+
+            self._samples_in_process += len(chunk)
+
+        if chunk:
+            if self._timeout is not None:
+                channel_id = self._idle_channel()
+                for idx, sample in chunk:
+                    self._pending.setdefault(idx, _PendingSample(sample))
+            else:
+                channel_id = min(self._channel_samples, key=self._channel_samples.get)
+
+            # the indices are sent apart, so the samples of a chunk, which fails to unpickle, can be reported
+            indices, samples = zip(*chunk)
+            self._channels[channel_id].send(pickle.dumps((indices, self._transport.pack(list(samples))),
+                                                         protocol=pickle.HIGHEST_PROTOCOL))
+            self._channel_samples[channel_id] += len(chunk)
+
+    def _send_end(self):
+        # the channels stay open, the tasks may still wait for the consumption of their streamed results,
+        # retried samples go to the tasks until all samples are done
+        if not self._end_sent and self._source_iter is None and not self._pending:
+            self._end_sent = True
+            for channel in self._channels.values():
+                channel.send(_END_OF_TASKS)
+
+    def _start(self, idx):
+        # the deadline of a run is set once the worker has started it, a retry sets a new one
+        pending = self._pending.get(idx)
+        if pending is not None and pending.owner is None and pending.deadline == float('inf'):
+            pending.deadline = time.monotonic() + self._timeout
+
+    def _expire(self):
+        # resolves the samples, whose deadlines have passed before any of their results has arrived
+        now = time.monotonic()
+        for idx, pending in list(self._pending.items()):
+            if pending.owner is not None or pending.deadline > now:
+                continue
+
+            if self._on_timeout == 'retry' and not pending.retried:
+                # the first run goes on, the sample is speculatively run by another worker process as well
+                pending.retried = True
+                pending.deadline = float('inf')
+                self._retries.append(idx)
+                continue
+
+            del self._pending[idx]
+            if self._on_timeout == 'skip':
+                self._results.extend([(idx, True, (False, None))])
+            else:
+                error = TimeoutError(f'Sample #{idx} has not been processed in {self._timeout}s')
+                self._results.extend([(idx, True, (False, error))])
+
+    def _claim(self, channel_id, results):
+        # only the results of the run of a sample, which has delivered first, are kept
+        claimed = []
+        for entry in results:
+            pending = self._pending.get(entry[0])
+            if pending is None or pending.owner not in (None, channel_id):
+                continue
+
+            pending.owner = channel_id
+            if entry[1]:
+                del self._pending[entry[0]]
+
+            claimed.append(entry)
+
+        return claimed
+
+    async def _get_output(self):
+        if self._timeout is None or not self._pending:
+            return await self._output.aget()
+
+        deadline = min(pending.deadline for pending in self._pending.values())
+        if deadline == float('inf'):  # none of the pending samples has been started yet
+            return await self._output.aget()
+
+        try:
+            return await asyncio.wait_for(self._output.aget(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            return None
+
+    async def __anext__(self):
+        while self._source_iter is not None or self._samples_in_process > 0:
+            while self._can_dispatch():
+                await self._dispatch()
+
+            self._send_end()
+
+            entry = self._results.pop()
+            if entry is not None:
+                _, last, (flag, result) = entry
+                if last:
+                    self._samples_in_process -= 1
+
+                if flag:
+                    return result
+                elif flag is None:  # a streamed message has been consumed, `result` is its channel
+                    self._channels[result].send(_ACK)
+                elif not self._ignore_errors and isinstance(result, Exception):
+                    raise result
+                continue
+
+            # timed out samples may still occupy the workers, which is awaited before more samples are dispatched
+            if self._samples_in_process > 0 or sum(self._channel_samples.values()) > 0:
+                try:
+                    output = await self._get_output()
+                except BufferClosed:
+                    raise RuntimeError('A worker process of the pool has exited') from None
+
+                if output is None:
+                    self._expire()
+                    continue
+
+                channel_id, result = output
+                if result is None:
+                    # a task ends only after its channel has been closed and all its samples have been processed
+                    if not self._end_sent or self._channel_samples[channel_id] > 0:
+                        raise RuntimeError('A map task of the pool has exited unexpectedly')
+                    continue
+
+                if result.startswith(_STARTED):
+                    self._start(_SAMPLE_IDX.unpack_from(result, len(_STARTED))[0])
+                    continue
+
+                results, stats = self._transport.unpack(result)
+
+                self._channel_samples[channel_id] -= sum(1 for _, last, _ in results if last)
+                if stats is not None:
+                    self._update_chunk_size(*stats)
+
+                if self._timeout is not None:
+                    streamed = stats is None
+                    results = self._claim(channel_id, results)
+                    if streamed and not results:  # the results of a duplicate run are dropped at once
+                        self._channels[channel_id].send(_ACK)
+                        continue
+
+                if stats is None:
+                    results.append((results[-1][0], False, (None, channel_id)))
+
+                self._results.extend(results)
         else:
-            if self._cancel_token is not None:
-                self._cancel_token.set()
-                self._cancel_token = None
             raise StopAsyncIteration()
 
 
 class MapDataOperation:
-    def __init__(self, *, source, map_func, num_parallel_calls, ordered=True, ignore_errors=False):
-        if num_parallel_calls == 0:
+    # the dumps of the functions are created for the pool of the first iterator
+    _FINGERPRINT_EXCLUDE = ('_dumps',)
+
+    def __init__(self, *, source, map_func, num_parallel_calls, ordered=True, ignore_errors=False,
+                 executor='process', pool=None, chunk_size=None, worker_init_fn=None, timeout=None,
+                 on_timeout='error'):
+        in_process = num_parallel_calls == 0 or executor != 'process'
+        if worker_init_fn is None and pool is not None:
+            in_process_init_fn = pool.worker_init_fn
+        else:
+            in_process_init_fn = worker_init_fn
+
+        if in_process_init_fn is not None and in_process:
+            map_func = _with_worker_state(map_func, _LazyWorkerState(in_process_init_fn))
+
+        if num_parallel_calls == 0 or executor == 'serial':
             self._get_iterator = lambda sid: _SerialIterator(
                 source.get_iter(sid), map_func, ignore_errors=ignore_errors)
+        elif executor == 'async':
+            self._get_iterator = lambda sid: _AsyncIterator(source.get_iter(sid), map_func,
+                                                            n_workers=num_parallel_calls,
+                                                            ordered=ordered,
+                                                            ignore_errors=ignore_errors)
+        elif executor == 'thread':
+            self._get_iterator = lambda sid: _ThreadIterator(source.get_iter(sid), map_func,
+                                                             n_workers=num_parallel_calls,
+                                                             ordered=ordered,
+                                                             ignore_errors=ignore_errors)
         else:
-            self._get_iterator = lambda sid: _ParallelIterator(sid,
-                                                               source.get_iter(sid), map_func,
-                                                               n_workers=num_parallel_calls,
-                                                               ordered=ordered,
-                                                               ignore_errors=ignore_errors)
+            self._map_func = map_func
+            self._worker_init_fn = worker_init_fn
+            self._dumps = None
+
+            def get_iterator(sid):
+                _pool = pool or ProcessPool.default()
+                map_func_dump, worker_init_fn_dump = self._get_dumps(_pool)
+
+                return _ParallelIterator(sid, source.get_iter(sid), map_func_dump,
+                                         n_workers=num_parallel_calls,
+                                         ordered=ordered,
+                                         pool=_pool,
+                                         worker_init_fn_dump=worker_init_fn_dump,
+                                         chunk_size=chunk_size,
+                                         timeout=timeout,
+                                         on_timeout=on_timeout,
+                                         ignore_errors=ignore_errors)
+
+            self._get_iterator = get_iterator
+
+    def _get_dumps(self, pool):
+        # the functions are serialized once per pool, so the workers' caches of loaded functions and states are hit
+        # every epoch
+        if self._dumps is None or self._dumps[0].shm_prefix != pool.shm_prefix:
+            worker_init_fn_dump = None
+            if self._worker_init_fn is not None:
+                worker_init_fn_dump = _SharedDump(self._worker_init_fn, pool)
+
+            self._dumps = (_SharedDump(self._map_func, pool), worker_init_fn_dump)
+
+        return self._dumps
 
     def get_iter(self, session_id):
         return self._get_iterator(session_id)
@@ -1,7 +1,5 @@
 import asyncio
 import aioitertools
-import threading
-import queue
 
 
 # class AsyncThread:
@@ -150,56 +148,65 @@ import queue
 class _PrefetchIterator:
     _none = object()
 
+    class _Error:
+        def __init__(self, exc):
+            self.exc = exc
+
     @staticmethod
-    async def _prefetch_fn(output_queue, source_iter, cancel_token):
-        while not cancel_token.is_set():
-            try:
-                sample = await aioitertools.next(source_iter)
-            except StopAsyncIteration:
-                sample = _PrefetchIterator._none
-                cancel_token.set()
-
-            while output_queue.full():
-                await asyncio.sleep(0)
-            else:
-                output_queue.put(sample)
+    async def _prefetch_fn(buffer, source_iter):
+        try:
+            while True:
+                try:
+                    sample = await aioitertools.next(source_iter)
+                except StopAsyncIteration:
+                    break
+
+                await buffer.put(sample)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await buffer.put(_PrefetchIterator._Error(e))
+        else:
+            await buffer.put(_PrefetchIterator._none)
 
     def __init__(self, session_id, source_iter, buffer_size):
         self._source_iter = source_iter
+        self._buffer_size = buffer_size
 
-        buffer = queue.Queue(buffer_size)
-        self._buffer = buffer
-
-        cancel_token = threading.Event()
-        self._cancel_token = cancel_token
-
+        self._buffer = None
         self._task = None
 
+    def __del__(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
     def __aiter__(self):
         return self
 
-    async def __anext__(self):
+    def start(self):
+        # must be called in the loop which iterates, so both the queue and the task belong to it
         if self._task is None:
+            self._buffer = asyncio.Queue(self._buffer_size)
             self._task = asyncio.get_event_loop().create_task(
-                _PrefetchIterator._prefetch_fn(self._buffer, self._source_iter, self._cancel_token))
+                _PrefetchIterator._prefetch_fn(self._buffer, self._source_iter))
+            self._source_iter = None
+
+    async def __anext__(self):
+        self.start()
 
         if self._buffer is None:
             raise StopAsyncIteration
         else:
-            while self._buffer.empty():
-                await asyncio.sleep(0)
-            else:
-                sample = self._buffer.get()
-                self._buffer.task_done()
+            sample = await self._buffer.get()
 
-            if sample is self._none:
+            if sample is self._none or isinstance(sample, _PrefetchIterator._Error):
                 self._buffer = None
+                await self._task
 
-                if self._cancel_token is not None:
-                    self._cancel_token.set()
-                    self._cancel_token = None
-                    await self._task
-                raise StopAsyncIteration
+                if sample is self._none:
+                    raise StopAsyncIteration
+                else:
+                    raise sample.exc
             else:
                 return sample
 
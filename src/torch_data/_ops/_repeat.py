@@ -0,0 +1,68 @@
+import aioitertools
+import itertools
+
+from .. import _shard
+from ._prefetch import _PrefetchIterator
+
+# elements of the next epoch, which are prefetched while the current epoch is consumed
+_NEXT_EPOCH_PREFETCH = 2
+
+
+class _RepeatIterator:
+    def __init__(self, session_id, source, count, shard):
+        self._session_id = session_id
+        self._source = source
+        self._shard = shard
+        self._epochs = itertools.count() if count is None else iter(range(count))
+
+        self._current = None
+        self._next = None
+        self._started = False
+        self._empty = True
+
+    def __aiter__(self):
+        return self
+
+    def _start_epoch(self):
+        if next(self._epochs, None) is None:
+            return None
+
+        source_iter = _shard.get_iter(self._source, self._session_id, self._shard)
+        epoch_iter = _PrefetchIterator(self._session_id, source_iter, _NEXT_EPOCH_PREFETCH)
+        epoch_iter.start()
+        return epoch_iter
+
+    async def __anext__(self):
+        if not self._started:
+            self._started = True
+            self._current = self._start_epoch()
+
+        while self._current is not None:
+            # the next epoch runs ahead, so its first elements are ready once the current one ends
+            if self._next is None:
+                self._next = self._start_epoch()
+
+            try:
+                sample = await aioitertools.next(self._current)
+            except StopAsyncIteration:
+                if self._empty:  # an empty dataset would be repeated forever
+                    self._epochs = iter(())
+                    self._next = None
+
+                self._current, self._next = self._next, None
+                self._empty = True
+            else:
+                self._empty = False
+                return sample
+
+        raise StopAsyncIteration()
+
+
+class RepeatDataOperation:
+    def __init__(self, *, source, count=None):
+        self._source = source
+        self._count = count
+
+    def get_iter(self, session_id):
+        # the iterators of the later epochs are created in the shard of the first one
+        return _RepeatIterator(session_id, self._source, self._count, _shard.current_shard())
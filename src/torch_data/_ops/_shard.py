@@ -0,0 +1,98 @@
+import aioitertools
+
+from .. import _shard
+from .._sources import is_random_access
+
+
+class _ShardIterator:
+    def __init__(self, source_iter, num_shards, index):
+        self._source_iter = source_iter
+        self._num_shards = num_shards
+        # elements to skip before the next element of the shard
+        self._skip = index
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while self._skip > 0:
+            self._skip -= 1
+            await aioitertools.next(self._source_iter)
+
+        sample = await aioitertools.next(self._source_iter)
+        self._skip = self._num_shards - 1
+        return sample
+
+
+class ShardDataOperation:
+    """Keeps every `num_shards`-th element of the source starting from `index`.
+
+    A source read by index is sharded by its indices, so the elements of the other shards are not read.
+    """
+
+    def __init__(self, *, source, num_shards, index):
+        self._source = source
+        self._num_shards = num_shards
+        self._index = index
+
+    @property
+    def random_access(self):
+        return is_random_access(self._source)
+
+    def indices(self):
+        return self._source.indices()[self._index::self._num_shards]
+
+    def get_indices_iter(self, session_id, indices):
+        return self._source.get_indices_iter(session_id, indices)
+
+    def gather_batch(self, indices):
+        return self._source.gather_batch(indices)
+
+    def get_iter(self, session_id):
+        if is_random_access(self._source):
+            return self.get_indices_iter(session_id, self.indices())
+
+        return _ShardIterator(self._source.get_iter(session_id), self._num_shards, self._index)
+
+
+class SourceShardDataOperation:
+    """Shards the sources of the pipeline, which yield only every `num_shards`-th of their elements.
+
+    The operations of the pipeline only run on the elements of the shard, so the output is a shard of the output of
+    the whole pipeline only if they map every element to one element. Used by `Dataset.shard_parallel`, whose
+    replicas of the pipeline together yield all its elements.
+    """
+
+    def __init__(self, *, source, num_shards, index):
+        self._source = source
+        self._num_shards = num_shards
+        self._index = index
+
+    def _shard(self):
+        shard = (self._index, self._num_shards)
+
+        outer = _shard.current_shard()
+        if outer is not None:  # a shard of this shard, it picks every `outer_num_shards`-th of its elements
+            outer_index, outer_num_shards = outer
+            shard = (self._index + self._num_shards * outer_index, self._num_shards * outer_num_shards)
+
+        return shard
+
+    # a shard of a source read by index is read by index as well
+
+    @property
+    def random_access(self):
+        return is_random_access(self._source)
+
+    def indices(self):
+        with _shard.sharded(self._shard()):
+            return self._source.indices()
+
+    def get_indices_iter(self, session_id, indices):
+        return self._source.get_indices_iter(session_id, indices)
+
+    def gather_batch(self, indices):
+        return self._source.gather_batch(indices)
+
+    def get_iter(self, session_id):
+        return _shard.get_iter(self._source, session_id, self._shard())
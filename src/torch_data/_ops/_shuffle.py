@@ -1,8 +1,35 @@
 import aioitertools
 import random
 
+import numpy as np
+
+from .._sources import is_random_access
+
+
+class _EpochSeeds:
+    # the random generator of every pass, its seed is derived from the seed of the operation and the number of the
+    # pass, so concurrent passes, e.g. the epochs of `repeat`, do not share a generator and every pass is reproducible
+    _FINGERPRINT_EXCLUDE = ('_epoch',)
+
+    def __init__(self, seed, reshuffle_each_iteration):
+        if seed is None:
+            seed = random.getrandbits(64)
+
+        self._seed = seed
+        self._reshuffle_each_iteration = reshuffle_each_iteration
+        self._epoch = 0
+
+    def next_rand(self):
+        epoch = 0
+        if self._reshuffle_each_iteration:
+            epoch, self._epoch = self._epoch, self._epoch + 1
+
+        return random.Random(f'{self._seed}:{epoch}')
+
 
 class _ShuffleIterator:
+    # the buffer is filled, then a random slot is returned and refilled by the next element, once the source is
+    # exhausted the last slot is moved into the returned one
     def __init__(self, source_iter, buffer_size, rand):
         self._source_iter = source_iter
         self._buffer_size = buffer_size
@@ -16,28 +43,132 @@ class _ShuffleIterator:
     async def __anext__(self):
         while self._source_iter is not None and len(self._buffer) < self._buffer_size:
             try:
-                sample = await aioitertools.next(self._source_iter)
-                cur_len = len(self._buffer)
-                in_idx = self._rand.randint(0, cur_len)  # including
-                self._buffer.insert(in_idx, sample)
+                self._buffer.append(await aioitertools.next(self._source_iter))
             except StopAsyncIteration:
                 self._source_iter = None
 
         if not self._buffer:
             raise StopAsyncIteration()
-        else:
-            return self._buffer.pop(0)
+
+        idx = self._rand.randrange(len(self._buffer))
+        sample = self._buffer[idx]
+
+        if self._source_iter is not None:
+            try:
+                self._buffer[idx] = await aioitertools.next(self._source_iter)
+                return sample
+            except StopAsyncIteration:
+                self._source_iter = None
+
+        last = self._buffer.pop()
+        if idx < len(self._buffer):
+            self._buffer[idx] = last
+
+        return sample
 
 
 class ShuffleDataOperation:
-    def __init__(self, *, source, buffer_size, seed=None):
+    def __init__(self, *, source, buffer_size, seed=None, reshuffle_each_iteration=True):
         self._source = source
         self._buffer_size = buffer_size
+        self._seeds = _EpochSeeds(seed, reshuffle_each_iteration)
 
-        if seed is None:
-            self._rand = random
+    def get_iter(self, session_id):
+        return _ShuffleIterator(self._source.get_iter(session_id), self._buffer_size, self._seeds.next_rand())
+
+
+# a permutation of `n` indices is a Feistel network over the smallest even number of bits, which holds `n`, positions
+# it maps beyond `n` are mapped again until they are in range, at most 4 times on average
+_FEISTEL_ROUNDS = 6
+_MIX = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xBF58476D1CE4E5B9))
+# indices are permuted and iterated in blocks of this size
+_PERMUTE_BLOCK = 1 << 16
+
+
+def _round_keys(rand):
+    return [np.uint64(rand.getrandbits(64)) for _ in range(_FEISTEL_ROUNDS)]
+
+
+def _permute(positions, n, keys):
+    half = max(1, ((n - 1).bit_length() + 1) // 2)
+    shift, mask = np.uint64(half), np.uint64((1 << half) - 1)
+
+    x = np.asarray(positions, dtype=np.uint64)
+    pending = np.ones(len(x), dtype=bool)
+    while pending.any():
+        left, right = x[pending] >> shift, x[pending] & mask
+        for key in keys:
+            h = (right ^ key) * _MIX[0]
+            h ^= h >> np.uint64(31)
+            h *= _MIX[1]
+            h ^= h >> np.uint64(29)
+            left, right = right, left ^ (h & mask)
+
+        x[pending] = (left << shift) | right
+        pending[pending] = x[pending] >= n
+
+    return x.astype(np.int64)
+
+
+class _PermutedIndices:
+    # the indices of `base` at the permuted `positions`, they are computed only for the slices, which are read
+    def __init__(self, base, keys, positions):
+        self._base = base
+        self._keys = keys
+        self._positions = positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _take(self, positions):
+        permuted = _permute(positions, len(self._base), self._keys)
+        if isinstance(self._base, range):
+            return self._base.start + self._base.step * permuted
+        else:
+            return np.asarray(self._base[permuted])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return _PermutedIndices(self._base, self._keys, self._positions[idx])
         else:
-            self._rand = random.Random(seed)
+            return int(self._take([self._positions[idx]])[0])
+
+    def __array__(self, dtype=None, copy=None):
+        result = self._take(np.arange(self._positions.start, self._positions.stop, self._positions.step))
+        return result if dtype is None else result.astype(dtype)
+
+    def __iter__(self):
+        for start in range(0, len(self), _PERMUTE_BLOCK):
+            yield from np.asarray(self[start:start + _PERMUTE_BLOCK]).tolist()
+
+
+class PermutationShuffleDataOperation:
+    """Shuffles a source read by index with a permutation of all its indices, no element is buffered.
+
+    The permutation is computed block by block, as the elements are read, so no array of all indices is made. Every
+    pass, e.g. every epoch, has another permutation, unless `reshuffle_each_iteration` is False, the permutation of
+    every pass is reproducible with `seed`. The shuffled source is read by index as well, e.g. its batches are
+    gathered at once.
+    """
+
+    def __init__(self, *, source, seed=None, reshuffle_each_iteration=True):
+        self._source = source
+        self._seeds = _EpochSeeds(seed, reshuffle_each_iteration)
+
+    @property
+    def random_access(self):
+        return is_random_access(self._source)
+
+    def indices(self):
+        base = self._source.indices()
+        keys = _round_keys(self._seeds.next_rand())
+        return _PermutedIndices(base, keys, range(len(base)))
+
+    def get_indices_iter(self, session_id, indices):
+        return self._source.get_indices_iter(session_id, indices)
+
+    def gather_batch(self, indices):
+        return self._source.gather_batch(indices)
 
     def get_iter(self, session_id):
-        return _ShuffleIterator(self._source.get_iter(session_id), self._buffer_size, self._rand)
+        return self.get_indices_iter(session_id, self.indices())
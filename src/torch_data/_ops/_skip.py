@@ -0,0 +1,32 @@
+import aioitertools
+
+from .._sources import is_random_access
+
+
+class _SkipIterator:
+    def __init__(self, source_iter, count):
+        self._source_iter = source_iter
+        self._count = count
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while self._count > 0:
+            self._count -= 1
+            await aioitertools.next(self._source_iter)
+
+        return await aioitertools.next(self._source_iter)
+
+
+class SkipDataOperation:
+    def __init__(self, *, source, count):
+        self._source = source
+        self._count = count
+
+    def get_iter(self, session_id):
+        if is_random_access(self._source):
+            # the skipped elements are not read at all
+            return self._source.get_indices_iter(session_id, self._source.indices()[self._count:])
+
+        return _SkipIterator(self._source.get_iter(session_id), self._count)
@@ -0,0 +1,280 @@
+import aioitertools
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import random
+import re
+import threading
+from contextlib import suppress
+
+from .. import _fingerprint, _records, _shard
+
+# a shard of the pipeline writes its elements into the files of its writers, then its manifest, which lists them
+_MANIFEST = re.compile(r'^(\d+)-of-(\d+)\.json$')
+
+
+def _shard_name(shard):
+    index, num_shards = shard or (0, 1)
+    return f'{index:05d}-of-{num_shards:05d}'
+
+
+def _complete_files(directory):
+    # the files of the first sharding with the manifests of all its shards, None if no sharding has them all
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return None
+
+    shardings = collections.defaultdict(dict)
+    for name in names:
+        match = _MANIFEST.match(name)
+        if match is not None:
+            shardings[int(match.group(2))][int(match.group(1))] = name
+
+    for num_shards, manifests in sorted(shardings.items()):
+        if len(manifests) != num_shards:
+            continue
+
+        files = []
+        for index in range(num_shards):
+            with open(os.path.join(directory, manifests[index])) as f:
+                files.extend(os.path.join(directory, name) for name in json.load(f)['files'])
+        return files
+
+    return None
+
+
+class _SnapshotReadIterator:
+    # the records are taken from the files in turn, which is the order they have been written in by the writers of
+    # a shard, and up to `num_parallel_reads` of the next ones are decoded by threads
+    def __init__(self, session_id, paths, num_parallel_reads):
+        self._session_id = session_id
+        self._paths = paths
+        self._num_parallel_reads = num_parallel_reads
+
+        self._executor = None
+        # the reader and the index of the next record of every file, which has more records
+        self._files = None
+        self._pending = collections.deque()
+
+    def __del__(self):
+        self._close()
+
+    def __aiter__(self):
+        return self
+
+    def _close(self):
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _read_next(self):
+        reader, idx = self._files.popleft()
+        if idx + 1 < len(reader):
+            self._files.append((reader, idx + 1))
+
+        return asyncio.get_event_loop().run_in_executor(self._executor, reader.__getitem__, idx)
+
+    async def __anext__(self):
+        if self._files is None:
+            readers = [_records.RecordReader(path) for path in self._paths]
+            self._files = collections.deque((reader, 0) for reader in readers if len(reader))
+            if self._files:
+                self._executor = concurrent.futures.ThreadPoolExecutor(self._num_parallel_reads,
+                                                                       thread_name_prefix='torch-data-snapshot')
+
+        while self._files and len(self._pending) < self._num_parallel_reads:
+            self._pending.append(self._read_next())
+
+        if not self._pending:
+            self._close()
+            raise StopAsyncIteration()
+
+        return await self._pending.popleft()
+
+
+class _SnapshotWriteIterator:
+    # element `i` is written by writer `i % num_writers`, an element is returned once it is written, while the next
+    # elements are written by the other writers
+    def __init__(self, session_id, source_iter, op, shard):
+        self._session_id = session_id
+        self._source_iter = source_iter
+        self._op = op
+        self._shard = shard
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(op._num_writers,
+                                                               thread_name_prefix='torch-data-snapshot')
+        self._writers = [_records.RecordWriter(op._file_path(shard, i), compression=op._compression)
+                         for i in range(op._num_writers)]
+        self._count = 0
+        self._pending = collections.deque()
+
+    def __del__(self):
+        self._finish(False)
+
+    def __aiter__(self):
+        return self
+
+    def _finish(self, complete):
+        if getattr(self, '_writers', None) is None:
+            return
+
+        for _, written in self._pending:
+            with suppress(RuntimeError):
+                written.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+        writers, self._writers = self._writers, None
+        try:
+            if complete:
+                for writer in writers:
+                    writer.close()
+                self._op._write_manifest(self._shard, writers, self._count)
+        finally:
+            for writer in writers:
+                writer.abort()
+            self._op._end(self._shard)
+
+    async def __anext__(self):
+        try:
+            while self._source_iter is not None and len(self._pending) < len(self._writers):
+                try:
+                    sample = await aioitertools.next(self._source_iter)
+                except StopAsyncIteration:
+                    self._source_iter = None
+                    break
+
+                writer = self._writers[self._count % len(self._writers)]
+                self._count += 1
+                self._pending.append((sample, asyncio.get_event_loop().run_in_executor(
+                    self._executor, writer.write, sample)))
+
+            if not self._pending:
+                self._finish(True)
+                raise StopAsyncIteration()
+
+            sample, written = self._pending.popleft()
+            await written
+            return sample
+        except StopAsyncIteration:
+            raise
+        except BaseException:
+            self._finish(False)
+            raise
+
+
+class _SnapshotIterator:
+    def __init__(self, session_id, op, shard):
+        self._session_id = session_id
+        self._op = op
+        self._shard = shard
+
+        self._iter = None
+
+    def __aiter__(self):
+        return self
+
+    async def _start(self):
+        while True:
+            files, writing, owned = self._op._begin(self._shard)
+            if files is not None:
+                self._iter = self._op._read_iter(self._session_id, files, self._shard)
+                return
+
+            if owned:
+                break
+
+            # another pass of this process writes the shard, its files are read once they are complete
+            await asyncio.wrap_future(writing)
+
+        try:
+            source_iter = _shard.get_iter(self._op._source, self._session_id, self._shard)
+            self._iter = _SnapshotWriteIterator(self._session_id, source_iter, self._op, self._shard)
+        except BaseException:
+            self._op._end(self._shard)
+            raise
+
+    async def __anext__(self):
+        if self._iter is None:
+            await self._start()
+
+        return await aioitertools.next(self._iter)
+
+
+class SnapshotDataOperation:
+    _FINGERPRINT_EXCLUDE = ('_lock', '_writing', '_rand')
+
+    def __init__(self, *, source, path, compression=None, num_writers=1, num_parallel_reads=None,
+                 shuffle_files=False, seed=None):
+        self._source = source
+        self._fingerprint = _fingerprint.fingerprint(source)
+        self._directory = os.path.join(path, self._fingerprint)
+        self._compression = compression
+        self._num_writers = num_writers
+        self._num_parallel_reads = num_parallel_reads or os.cpu_count()
+        self._shuffle_files = shuffle_files
+
+        if seed is None:
+            self._rand = random
+        else:
+            self._rand = random.Random(seed)
+
+        self._lock = threading.Lock()
+        # shards being written by the passes of this process
+        self._writing = {}
+
+    def _file_path(self, shard, writer):
+        return os.path.join(self._directory, f'{_shard_name(shard)}.{writer:03d}.rec')
+
+    def _write_manifest(self, shard, writers, count):
+        manifest = {
+            'fingerprint': self._fingerprint,
+            'compression': self._compression,
+            'elements': count,
+            'files': [os.path.basename(writer.path) for writer in writers],
+        }
+
+        path = os.path.join(self._directory, f'{_shard_name(shard)}.json')
+        tmp_path = f'{path}.tmp-{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    def _begin(self, shard):
+        # returns the files of a complete snapshot, otherwise the pass writing the shard and whether the caller owns it
+        with self._lock:
+            files = _complete_files(self._directory)
+            if files is not None:
+                return files, None, False
+
+            writing = self._writing.get(shard)
+            if writing is not None:
+                return None, writing, False
+
+            os.makedirs(self._directory, exist_ok=True)
+            writing = self._writing[shard] = concurrent.futures.Future()
+            return None, writing, True
+
+    def _end(self, shard):
+        with self._lock:
+            writing = self._writing.pop(shard, None)
+
+        if writing is not None:
+            writing.set_result(None)
+
+    def _read_iter(self, session_id, files, shard):
+        # the files are the unit of sharding and shuffling
+        if shard is not None:
+            index, num_shards = shard
+            files = files[index::num_shards]
+        if self._shuffle_files:
+            files = list(files)
+            self._rand.shuffle(files)
+
+        return _SnapshotReadIterator(session_id, files, self._num_parallel_reads)
+
+    def get_iter(self, session_id):
+        return _SnapshotIterator(session_id, self, _shard.current_shard())
@@ -0,0 +1,106 @@
+import glob
+import itertools
+import mmap
+import os
+import pickle
+import tempfile
+
+from .. import _serialization
+
+# smaller buffers are cheaper to copy through the channel itself
+_SHM_THRESHOLD = 1 << 16
+_ALIGNMENT = 64
+
+# shared by all transports of the process, segment names must be unique per process
+_counter = itertools.count()
+
+
+def _shm_dir():
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    else:
+        return tempfile.gettempdir()
+
+
+def cleanup(prefix):
+    for path in glob.glob(os.path.join(_shm_dir(), prefix + '*')):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class SharedMemoryTransport:
+    """Serializes messages of a parallel map, large arrays and tensors go through shared memory.
+
+    All large buffers of a message are written into one shared memory segment, only its name and offsets are sent
+    through the channel. The receiver maps the segment and unlinks it at once, the unpickled arrays and tensors are
+    zero-copy views of the mapping, which is released together with the last of them.
+
+    A `shared` message can be unpacked any number of times, e.g. by every worker, its segment stays until the message
+    is discarded. It is mapped copy-on-write, the pages are shared until a process writes to them, then the process
+    gets its own copy of the written pages.
+    """
+
+    def __init__(self, prefix, threshold=_SHM_THRESHOLD):
+        self._prefix = prefix
+        self._threshold = threshold
+
+    def pack(self, obj, *, shared=False):
+        payload, buffers = _serialization.dumps(obj, oob_threshold=self._threshold)
+        if not buffers:
+            return pickle.dumps((payload, None, None, shared), protocol=pickle.HIGHEST_PROTOCOL)
+
+        layout = []
+        size = 0
+        for buffer in buffers:
+            nbytes = buffer.raw().nbytes
+            layout.append((size, nbytes))
+            size += (nbytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+        name = f'{self._prefix}{os.getpid()}-{next(_counter)}'
+        fd = os.open(os.path.join(_shm_dir(), name), os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            for buffer, (offset, nbytes) in zip(buffers, layout):
+                data = buffer.raw()
+                while nbytes:
+                    written = os.pwrite(fd, data, offset)
+                    data, offset, nbytes = data[written:], offset + written, nbytes - written
+        finally:
+            os.close(fd)
+
+        return pickle.dumps((payload, name, layout, shared), protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def unpack(data):
+        payload, name, layout, shared = pickle.loads(data)
+        if name is None:
+            return _serialization.loads(payload)
+
+        path = os.path.join(_shm_dir(), name)
+        if shared:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                segment = memoryview(mmap.mmap(fd, os.fstat(fd).st_size, access=mmap.ACCESS_COPY))
+            finally:
+                os.close(fd)
+        else:
+            fd = os.open(path, os.O_RDWR)
+            try:
+                os.unlink(path)
+                segment = memoryview(mmap.mmap(fd, os.fstat(fd).st_size))
+            finally:
+                os.close(fd)
+
+        buffers = [segment[offset:offset + nbytes] for offset, nbytes in layout]
+        return _serialization.loads(payload, buffers=buffers)
+
+    def discard(self, data):
+        # releases the shared memory of a message, which is never going to be unpacked
+        _, name, _, _ = pickle.loads(data)
+        if name is not None:
+            try:
+                os.unlink(os.path.join(_shm_dir(), name))
+            except OSError:
+                pass
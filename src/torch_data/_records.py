@@ -0,0 +1,200 @@
+import lzma
+import mmap
+import os
+import struct
+import uuid
+import zlib
+
+from . import _serialization
+
+# a file starts with the magic and ends with the index of its records and the trailer, a file without the trailer
+# has not been completed
+_MAGIC = b'TDREC001'
+# offset of the index, number of records, compression of the records
+_TRAILER = struct.Struct('<QQB8s')
+# payload size, number of out-of-band buffers, then the size of every buffer
+_RECORD = struct.Struct('<QI')
+_SIZE = struct.Struct('<Q')
+
+# buffers are aligned, so the arrays and tensors decoded from a mapping are aligned as well
+_ALIGNMENT = 64
+# smaller arrays and tensors are kept in the payload
+_OOB_THRESHOLD = 1 << 10
+
+
+# the payload and the buffers of a record are compressed separately, so a record is decoded on its own
+_COMPRESSIONS = (None, 'zlib', 'lzma')
+_COMPRESS = {'zlib': zlib.compress, 'lzma': lzma.compress}
+_DECOMPRESS = {'zlib': zlib.decompress, 'lzma': lzma.decompress}
+
+
+def _padding(offset):
+    return -offset % _ALIGNMENT
+
+
+class RecordWriter:
+    """Writes records into a temporary file next to `path`, which is moved to `path` once the writer is closed.
+
+    A record is any object, which can be pickled, the files are read by `Dataset.from_record_files`. Contiguous
+    arrays and tensors of a record are written as raw aligned buffers, so they can be decoded without a copy from
+    a mapping of the file, unless the records are compressed with `compression`, 'zlib' or 'lzma'. A writer, which is
+    aborted or never closed, leaves nothing at `path`. Used as a context manager, the writer is closed at the end of
+    the block, or aborted if the block raises. Unless `sync` is False, e.g. for temporary files, the file is flushed
+    to the disk before it is moved.
+    """
+
+    def __init__(self, path, compression=None, *, sync=True):
+        if compression not in _COMPRESSIONS:
+            raise ValueError(f'unknown compression {compression!r}')
+
+        self.path = path
+        self.compression = compression
+        self._sync = sync
+        self._tmp_path = f'{path}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(_MAGIC)
+        self._offsets = []
+
+    def __del__(self):
+        self.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def write(self, obj):
+        payload, buffers = _serialization.dumps(obj, oob_threshold=_OOB_THRESHOLD)
+        buffers = [buffer.raw() for buffer in buffers]
+        if self.compression is not None:
+            compress = _COMPRESS[self.compression]
+            payload = compress(payload)
+            buffers = [memoryview(compress(buffer)) for buffer in buffers]
+
+        self._write(payload, buffers)
+
+    def _write(self, payload, buffers):
+        offset = self._file.tell()
+        self._offsets.append(offset)
+
+        header = _RECORD.pack(len(payload), len(buffers)) + b''.join(_SIZE.pack(b.nbytes) for b in buffers)
+        self._file.write(header)
+        self._file.write(payload)
+
+        offset += len(header) + len(payload)
+        for buffer in buffers:
+            self._file.write(b'\0' * _padding(offset))
+            offset += _padding(offset)
+            self._file.write(buffer)
+            offset += buffer.nbytes
+
+    def close(self):
+        if self._file is None:
+            return
+
+        index_offset = self._file.tell()
+        self._file.write(b''.join(_SIZE.pack(offset) for offset in self._offsets))
+        self._file.write(_TRAILER.pack(index_offset, len(self._offsets), _COMPRESSIONS.index(self.compression),
+                                       _MAGIC))
+        self._file.flush()
+        if self._sync:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        if getattr(self, '_file', None) is None:
+            return
+
+        self._file.close()
+        self._file = None
+        try:
+            os.unlink(self._tmp_path)
+        except OSError:
+            pass
+
+
+class RecordReader:
+    """Random access to the records of a completed file, which is mapped into memory.
+
+    The mapping is copy-on-write, decoded arrays and tensors are views of it, which can be written to without
+    changing the file. Those of compressed records are decompressed into their own memory.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < len(_MAGIC) + _TRAILER.size:
+                raise ValueError(f'{path} is not a record file')
+
+            self._mmap = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)
+
+        index_offset, count, compression, magic = _TRAILER.unpack_from(self._mmap, size - _TRAILER.size)
+        if self._mmap[:len(_MAGIC)] != _MAGIC or magic != _MAGIC or compression >= len(_COMPRESSIONS) \
+                or index_offset + count * _SIZE.size != size - _TRAILER.size:
+            raise ValueError(f'{path} is not a completed record file')
+
+        self.path = path
+        self.compression = _COMPRESSIONS[compression]
+
+        self._data = memoryview(self._mmap)
+        self._index_offset = index_offset
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def _read(self, idx):
+        offset, = _SIZE.unpack_from(self._data, self._index_offset + idx * _SIZE.size)
+        payload_size, n_buffers = _RECORD.unpack_from(self._data, offset)
+        offset += _RECORD.size
+
+        sizes = [_SIZE.unpack_from(self._data, offset + i * _SIZE.size)[0] for i in range(n_buffers)]
+        offset += n_buffers * _SIZE.size
+
+        payload = self._data[offset:offset + payload_size]
+        offset += payload_size
+
+        buffers = []
+        for nbytes in sizes:
+            offset += _padding(offset)
+            buffers.append(self._data[offset:offset + nbytes])
+            offset += nbytes
+
+        return payload, buffers
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('record index out of range')
+
+        payload, buffers = self._read(idx)
+        if self.compression is not None:
+            decompress = _DECOMPRESS[self.compression]
+            payload = decompress(payload)
+            buffers = [bytearray(decompress(buffer)) for buffer in buffers]
+
+        return _serialization.loads(payload, buffers=buffers)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+def is_complete(path):
+    try:
+        RecordReader(path)
+    except (OSError, ValueError):
+        return False
+    else:
+        return True
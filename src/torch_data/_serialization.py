@@ -0,0 +1,87 @@
+import dill
+import io
+import pickle
+import types
+
+try:
+    import numpy as np
+except (ImportError, ModuleNotFoundError):
+    np = None
+
+try:
+    import torch
+except (ImportError, ModuleNotFoundError):
+    torch = None
+
+_PROTOCOL = 5
+
+
+def _rebuild_tensor(data, dtype, shape):
+    return torch.from_numpy(data).view(dtype).reshape(shape)
+
+
+def _reduce_tensor(obj):
+    # plain CPU tensors are reduced to their raw bytes, so large ones can travel out-of-band as well
+    if torch is not None and type(obj) is torch.Tensor \
+            and obj.device.type == 'cpu' and obj.layout == torch.strided and not obj.requires_grad:
+        data = obj.detach().contiguous().reshape(-1).view(torch.uint8).numpy()
+        return _rebuild_tensor, (data, obj.dtype, tuple(obj.shape))
+    else:
+        return NotImplemented
+
+
+class _Pickler(pickle.Pickler):
+    def reducer_override(self, obj):
+        # functions and classes of `__main__` would be pickled by reference, but the `__main__` of a worker is not the
+        # one of the parent, e.g. their definitions under `if __name__ == '__main__':` are missing, dill pickles them
+        # by value
+        if isinstance(obj, (type, types.FunctionType)) and obj.__module__ == '__main__':
+            raise pickle.PicklingError(f'{obj.__qualname__} is defined in __main__')
+
+        return _reduce_tensor(obj)
+
+
+class _DillPickler(dill.Pickler):
+    def reducer_override(self, obj):
+        return _reduce_tensor(obj)
+
+    def save(self, obj, save_persistent_id=True):
+        # dill reduces arrays with `__reduce__`, which keeps their data in-band
+        if np is not None and type(obj) is np.ndarray:
+            return pickle._Pickler.save(self, obj, save_persistent_id)
+
+        return super().save(obj, save_persistent_id)
+
+
+def _dumps(pickler_cls, obj, buffer_callback):
+    with io.BytesIO() as f:
+        pickler_cls(f, protocol=_PROTOCOL, buffer_callback=buffer_callback).dump(obj)
+        return f.getvalue()
+
+
+def dumps(obj, oob_threshold=None):
+    """Serializes `obj`, returns the payload and the list of its out-of-band buffers.
+
+    Contiguous numpy arrays and CPU tensors of at least `oob_threshold` bytes are not copied into the payload,
+    their `pickle.PickleBuffer`s are returned instead and must be passed to `loads` in the same order.
+    """
+    buffers = []
+
+    def buffer_callback(buffer):
+        if oob_threshold is None or buffer.raw().nbytes < oob_threshold:
+            return True
+        else:
+            buffers.append(buffer)
+            return False
+
+    try:
+        payload = _dumps(_Pickler, obj, buffer_callback)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        buffers.clear()
+        payload = _dumps(_DillPickler, obj, buffer_callback)
+
+    return payload, buffers
+
+
+def loads(payload, buffers=()):
+    return pickle.loads(payload, buffers=buffers)
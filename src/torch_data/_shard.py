@@ -0,0 +1,28 @@
+import contextlib
+import contextvars
+
+# `(index, num_shards)` of the pipeline whose iterators are being created, sources read it in `get_iter`
+_current_shard = contextvars.ContextVar('torch_data_shard', default=None)
+
+
+def current_shard():
+    return _current_shard.get()
+
+
+def get_iter(source, session_id, shard):
+    """Creates the iterator of `source`, its sources yield only the elements of `shard`.
+
+    Iterators of all sources are created synchronously by `get_iter`, so the shard is seen by the whole upstream
+    pipeline and by nothing else. `None` is the whole dataset.
+    """
+    with sharded(shard):
+        return source.get_iter(session_id)
+
+
+@contextlib.contextmanager
+def sharded(shard):
+    token = _current_shard.set(shard)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
@@ -2,6 +2,8 @@
 #
 
 from ._generator import GeneratorDataSource
+from ._random_access import IndexableDataSource, RandomAccessDataSource, is_random_access
+from ._record_files import RecordFilesDataSource
 from ._tensor_slices import TensorSlicesDataSource
 from ._tensors import TensorsDataSource
 
@@ -1,5 +1,7 @@
 import aioitertools
 
+from .. import _shard
+
 
 class _GeneratorIterator:
     def __init__(self, session_id, iterator):
@@ -21,12 +23,24 @@ class _GeneratorIterator:
 
 
 class GeneratorDataSource:
-    def __init__(self, *, generator, args=None):
+    def __init__(self, *, generator, args=None, shard_aware=False):
         if args is None:
             args = tuple()
 
         self._generator = generator
         self._args = args
+        self._shard_aware = shard_aware
 
     def get_iter(self, session_id):
-        return _GeneratorIterator(session_id, aioitertools.iter(self._generator(*self._args)))
+        shard = _shard.current_shard()
+
+        if self._shard_aware:
+            # the generator yields only the elements of its shard, e.g. reads only its part of the files
+            iterator = aioitertools.iter(self._generator(*self._args, shard=shard))
+        elif shard is None:
+            iterator = aioitertools.iter(self._generator(*self._args))
+        else:
+            index, num_shards = shard
+            iterator = aioitertools.islice(self._generator(*self._args), index, None, num_shards)
+
+        return _GeneratorIterator(session_id, iterator)
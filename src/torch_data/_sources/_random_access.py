@@ -0,0 +1,101 @@
+from .. import _shard
+
+# elements are read in blocks of this many indices, one `gather` per block
+_GATHER_BLOCK = 64
+
+
+class _IndicesIterator:
+    _none = object()
+
+    def __init__(self, session_id, source, indices):
+        self._session_id = session_id
+        self._source = source
+        self._indices = indices
+
+        self._pos = 0
+        self._block = iter(())
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            sample = next(self._block, self._none)
+            if sample is not self._none:
+                return sample
+
+            if self._pos >= len(self._indices):
+                raise StopAsyncIteration()
+
+            block = self._indices[self._pos:self._pos + _GATHER_BLOCK]
+            self._pos += len(block)
+            self._block = iter(self._source.gather(block))
+
+
+class RandomAccessDataSource:
+    """Base of the sources, whose elements are read by their index.
+
+    Subclasses implement `__len__` and `get_item`, and `gather`, if the elements of many indices are read faster at
+    once, e.g. by a single fancy indexing of an array. The indices are a sequence, a `range` of them can be read as
+    a slice. Operations read such a source by index, e.g. skip elements or take only those of a shard without reading
+    the others.
+    """
+
+    # whether the elements of this instance can be read by index
+    random_access = True
+
+    def __len__(self):
+        raise NotImplementedError()
+
+    def get_item(self, idx):
+        raise NotImplementedError()
+
+    def gather(self, indices):
+        return [self.get_item(idx) for idx in indices]
+
+    def gather_batch(self, indices):
+        """The batch of the elements of `indices` as `batch` would make it, or None if the elements are not stacked
+        by the source."""
+        return None
+
+    def indices(self):
+        """The indices of the elements of the shard, whose iterators are being created, in their order."""
+        indices = range(len(self))
+
+        shard = _shard.current_shard()
+        if shard is not None:
+            index, num_shards = shard
+            indices = indices[index::num_shards]
+
+        return indices
+
+    def get_indices_iter(self, session_id, indices):
+        return _IndicesIterator(session_id, self, indices)
+
+    def get_iter(self, session_id):
+        return self.get_indices_iter(session_id, self.indices())
+
+
+def is_random_access(source):
+    # sources and operations, which pass the reads by index to their source, have `random_access`, `indices` and
+    # `get_indices_iter`
+    return getattr(source, 'random_access', False)
+
+
+class IndexableDataSource(RandomAccessDataSource):
+    # an object with `__len__` and `__getitem__`, e.g. a map-style dataset of PyTorch, its `__getitems__` reads many
+    # elements at once
+    def __init__(self, *, data):
+        self._data = data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_item(self, idx):
+        return self._data[idx]
+
+    def gather(self, indices):
+        if hasattr(self._data, '__getitems__'):
+            return self._data.__getitems__(list(indices))
+        else:
+            return super().gather(indices)
@@ -0,0 +1,51 @@
+from .. import _records, _shard
+
+
+class _RecordFilesIterator:
+    def __init__(self, session_id, paths, shard):
+        self._session_id = session_id
+        self._paths = iter(paths)
+        self._shard = shard
+
+        self._reader = None
+        self._indices = None
+        # records of the previous files, a shard takes every `num_shards`-th record of all files
+        self._offset = 0
+
+    def __aiter__(self):
+        return self
+
+    def _next_file(self):
+        path = next(self._paths, None)
+        if path is None:
+            return False
+
+        self._reader = _records.RecordReader(path)
+        if self._shard is None:
+            self._indices = iter(range(len(self._reader)))
+        else:
+            # the index of a file is read, so the records of the other shards are skipped without decoding them
+            index, num_shards = self._shard
+            self._indices = iter(range((index - self._offset) % num_shards, len(self._reader), num_shards))
+
+        self._offset += len(self._reader)
+        return True
+
+    async def __anext__(self):
+        while True:
+            if self._indices is not None:
+                idx = next(self._indices, None)
+                if idx is not None:
+                    return self._reader[idx]
+
+            if not self._next_file():
+                self._reader = self._indices = None
+                raise StopAsyncIteration()
+
+
+class RecordFilesDataSource:
+    def __init__(self, *, paths):
+        self._paths = paths
+
+    def get_iter(self, session_id):
+        return _RecordFilesIterator(session_id, self._paths, _shard.current_shard())
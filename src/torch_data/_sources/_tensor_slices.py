@@ -1,3 +1,18 @@
+import itertools
+from collections.abc import Mapping
+
+from .. import _shard
+from ._random_access import RandomAccessDataSource
+
+try:
+    import numpy as np
+except (ImportError, ModuleNotFoundError):
+    np = None
+
+try:
+    import torch
+except (ImportError, ModuleNotFoundError):
+    torch = None
 
 
 class _SingleTensorSlicesIterator:
@@ -40,14 +55,70 @@ class _MultiTensorSlicesIterator:
             return sample
 
 
-class TensorSlicesDataSource:
+def _is_indexable(tensor):
+    return hasattr(tensor, '__len__') and hasattr(tensor, '__getitem__') and not isinstance(tensor, Mapping)
+
+
+def _is_array(tensor):
+    return (np is not None and isinstance(tensor, np.ndarray)) or (torch is not None and isinstance(tensor, torch.Tensor))
+
+
+def _gather(tensor, indices):
+    # a range is a slice, a view of arrays and tensors, other indices of arrays and tensors are a single fancy indexing
+    if isinstance(indices, range) and (_is_array(tensor) or isinstance(tensor, (list, tuple, str))):
+        return tensor[indices.start:indices.stop:indices.step]
+    elif np is not None and isinstance(tensor, np.ndarray):
+        return tensor[np.asarray(indices)]
+    elif torch is not None and isinstance(tensor, torch.Tensor):
+        return tensor[torch.as_tensor(np.asarray(indices))]
+    else:
+        return [tensor[idx] for idx in indices]
+
+
+class TensorSlicesDataSource(RandomAccessDataSource):
     def __init__(self, *, tensors=None):
         self._tensors = tensors
+        # other iterables are only iterated
+        self.random_access = all(map(_is_indexable, tensors))
+
+        if len(self._tensors) == 1:
+            self.__get_iterator = lambda sid, iters: _SingleTensorSlicesIterator(sid, iters[0])
+        else:
+            self.__get_iterator = lambda sid, iters: _MultiTensorSlicesIterator(sid, iters)
+
+    def __len__(self):
+        return min(len(t) for t in self._tensors)
 
+    def get_item(self, idx):
         if len(self._tensors) == 1:
-            self.__get_iterator = lambda sid: _SingleTensorSlicesIterator(sid, iter(self._tensors[0]))
+            return self._tensors[0][idx]
+        else:
+            return tuple(t[idx] for t in self._tensors)
+
+    def gather(self, indices):
+        columns = [_gather(t, indices) for t in self._tensors]
+        if len(columns) == 1:
+            return columns[0]
         else:
-            self.__get_iterator = lambda sid: _MultiTensorSlicesIterator(sid, [iter(t) for t in self._tensors])
+            return zip(*columns)
+
+    def gather_batch(self, indices):
+        # the rows of arrays and tensors are stacked by a single slice or fancy indexing, a slice is a view
+        if not all(map(_is_array, self._tensors)):
+            return None
+
+        columns = tuple(_gather(t, indices) for t in self._tensors)
+        return columns[0] if len(columns) == 1 else columns
 
     def get_iter(self, session_id):
-        return self.__get_iterator(session_id)
+        if self.random_access:
+            return super().get_iter(session_id)
+
+        shard = _shard.current_shard()
+        if shard is None:
+            iters = [iter(t) for t in self._tensors]
+        else:
+            index, num_shards = shard
+            iters = [itertools.islice(t, index, None, num_shards) for t in self._tensors]
+
+        return self.__get_iterator(session_id, iters)
@@ -1,3 +1,5 @@
+from .. import _shard
+
 
 class _TensorsIterator:
     def __init__(self, session_id, tensors):
@@ -22,4 +24,8 @@ class TensorsDataSource:
         self._tensors = tensors
 
     def get_iter(self, session_id):
+        shard = _shard.current_shard()
+        if shard is not None and shard[0] != 0:  # the only element belongs to the first shard
+            return _TensorsIterator(session_id, None)
+
         return _TensorsIterator(session_id, self._tensors)
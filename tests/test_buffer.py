@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import unittest
+
+from torch_data._buffer import BufferClosed, ThreadSafeBuffer
+
+
+def _run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class TestThreadSafeBuffer(unittest.TestCase):
+    def test_cross_thread(self):
+        buffer = ThreadSafeBuffer(2)
+
+        def producer():
+            for i in range(100):
+                buffer.put(i)
+            buffer.close()
+
+        async def consumer():
+            out = []
+            while True:
+                try:
+                    out.append(await buffer.aget())
+                except BufferClosed:
+                    return out
+
+        thread = threading.Thread(target=producer)
+        thread.start()
+        out = _run(consumer())
+        thread.join()
+
+        self.assertEqual(out, list(range(100)))
+
+    def test_close(self):
+        buffer = ThreadSafeBuffer(1)
+        buffer.put(1)
+
+        async def producer():
+            await buffer.aput(2)
+
+        thread = threading.Thread(target=lambda: self.assertRaises(BufferClosed, _run, producer()))
+        thread.start()
+        buffer.close()
+        thread.join()
+
+        self.assertEqual(buffer.get(), 1)
+        self.assertRaises(BufferClosed, buffer.get)
+        self.assertRaises(BufferClosed, buffer.put, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
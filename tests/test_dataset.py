@@ -1,8 +1,20 @@
+import os
 import unittest
 
 import torch_data
 
 
+_snapshot_calls = []
+
+
+def _snapshot_gen(n):
+    import numpy as np
+
+    _snapshot_calls.append(n)
+    for i in range(n):
+        yield i, np.full(2000, i, dtype=np.int64)
+
+
 class TestDataset(unittest.TestCase):
     def test_from_generator(self):
         ds = torch_data.Dataset.from_generator(range, args=(1000,))
@@ -37,6 +49,58 @@ class TestDataset(unittest.TestCase):
 
         self.assertEqual(i, 249)
 
+    def test_from_tensor_slices_random_access(self):
+        import numpy as np
+        import torch
+
+        array = np.arange(1000).reshape(500, 2)
+        tensor = torch.arange(500)
+        ds = torch_data.Dataset.from_tensor_slices(array, tensor, [str(i) for i in range(600)])
+
+        samples = list(ds)
+        self.assertEqual(len(samples), 500)
+        for i, (a, t, s) in enumerate(samples):
+            self.assertEqual(a.tolist(), [2 * i, 2 * i + 1])
+            self.assertEqual(t.item(), i)
+            self.assertEqual(s, str(i))
+
+        # rows of arrays are views
+        self.assertTrue(np.shares_memory(samples[0][0], array))
+
+        self.assertEqual([t.item() for _, t, _ in ds.skip(490)], list(range(490, 500)))
+        self.assertEqual([t.item() for _, t, _ in ds.shard(7, 3).skip(70)], [493])
+        self.assertEqual(list(ds.skip(1000)), [])
+
+        # other iterables are iterated
+        ds = torch_data.Dataset.from_tensor_slices(iter(range(5)), {10: 'a', 11: 'b', 12: 'c'})
+        self.assertEqual(list(ds.skip(1)), [(1, 11), (2, 12)])
+        self.assertEqual(list(torch_data.Dataset.from_generator(range, args=(5,)).skip(3)), [3, 4])
+
+    def test_from_indexable(self):
+        reads = []
+
+        class Data:
+            def __len__(self):
+                return 1000
+
+            def __getitem__(self, idx):
+                reads.append(idx)
+                return idx * 2
+
+        class BulkData(Data):
+            def __getitems__(self, indices):
+                reads.append(indices)
+                return [idx * 2 for idx in indices]
+
+        ds = torch_data.Dataset.from_indexable(Data())
+        self.assertEqual(list(ds.shard(100, 5).skip(8)), [1610, 1810])
+        self.assertEqual(reads, [805, 905])
+
+        reads.clear()
+        ds = torch_data.Dataset.from_indexable(BulkData())
+        self.assertEqual(list(ds.skip(900)), list(range(1800, 2000, 2)))
+        self.assertEqual(reads, [list(range(900, 964)), list(range(964, 1000))])
+
     def test_from_tensors(self):
         self.assertRaises(AssertionError, torch_data.Dataset.from_tensors)
         self.assertRaises(AssertionError, torch_data.Dataset.from_tensors, [1, 2], [2], tensors=([1], [2]))
@@ -54,6 +118,46 @@ class TestDataset(unittest.TestCase):
 
         self.assertRaises(StopIteration, next, ds_iter)
 
+    def test_from_record_files(self):
+        import tempfile
+
+        import numpy as np
+        import torch
+
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, f'{i}.rec') for i in range(3)]
+            compressions = (None, 'zlib', 'lzma')
+            for f, (path, compression) in enumerate(zip(paths, compressions)):
+                with torch_data.RecordWriter(path, compression=compression) as writer:
+                    for i in range(f * 10, f * 10 + 10):
+                        writer.write({'i': i, 'a': np.full((64, 64), i, dtype=np.float32),
+                                      't': torch.full((300,), i, dtype=torch.bfloat16), 's': str(i)})
+
+            # an aborted writer leaves no file
+            with self.assertRaises(ValueError):
+                with torch_data.RecordWriter(os.path.join(tmp, 'aborted.rec')) as writer:
+                    writer.write(1)
+                    raise ValueError()
+            self.assertEqual(sorted(os.listdir(tmp)), ['0.rec', '1.rec', '2.rec'])
+
+            samples = list(torch_data.Dataset.from_record_files(paths))
+            self.assertEqual([s['i'] for s in samples], list(range(30)))
+            for s in samples:
+                self.assertEqual(s['s'], str(s['i']))
+                np.testing.assert_array_equal(s['a'], np.full((64, 64), s['i'], dtype=np.float32))
+                self.assertTrue(torch.equal(s['t'], torch.full((300,), s['i'], dtype=torch.bfloat16)))
+                s['a'][0, 0] = -1
+
+            # the arrays of uncompressed records are aligned views of the mapped file, which is not changed by writing
+            # them
+            self.assertFalse(samples[0]['a'].flags.owndata)
+            self.assertEqual(samples[0]['a'].ctypes.data % 64, 0)
+            self.assertEqual(next(iter(torch_data.Dataset.from_record_files(paths[0])))['a'][0, 0], 0)
+
+            ds = torch_data.Dataset.from_record_files(paths).map(lambda s: s['i'])
+            self.assertEqual(list(ds.shard(4, 1)), list(range(1, 30, 4)))
+            self.assertEqual(sorted(ds.shard_parallel(3)), list(range(30)))
+
     def test_concatenate(self):
         self.assertRaises(AssertionError, torch_data.Dataset.concatenate)
         self.assertRaises(AssertionError, torch_data.Dataset.concatenate, [1, 2], torch_data.Dataset())
@@ -159,6 +263,392 @@ class TestDataset(unittest.TestCase):
         self.assertEqual(i, 99)
         self.assertEqual(sum_1, sum_2)
 
+    def test_parallel_map_chunks(self):
+        for chunk_size in (7, None):
+            ds = torch_data.Dataset.from_generator(range, args=(1000,))
+            out = list(ds.map(lambda x: x**2, num_parallel_calls=3, ordered=True, chunk_size=chunk_size))
+            self.assertEqual(out, [i**2 for i in range(1000)])
+
+            ds = torch_data.Dataset.from_generator(range, args=(50,))
+            out = ds.map(lambda x: torch_data.Dataset.from_tensor_slices([x, -x]), num_parallel_calls=3,
+                         ordered=True, chunk_size=chunk_size)
+            self.assertEqual(list(out), [j for i in range(50) for j in (i, -i)])
+
+    def test_parallel_map_ordered_stress(self):
+        import time
+
+        def map_func(x):
+            # a few slow samples keep thousands of the following ones waiting for them
+            if x % 2000 == 0:
+                time.sleep(0.2)
+            return x
+
+        ds = torch_data.Dataset.from_generator(range, args=(20000,))
+        ds = ds.map(map_func, num_parallel_calls=4, ordered=True, chunk_size=256)
+
+        self.assertEqual(list(ds), list(range(20000)))
+
+    def test_parallel_map_ds_streaming(self):
+        import time
+
+        def records(x):
+            for i in range(20000):
+                if i == 1000:
+                    time.sleep(1.0)
+                yield x, i, time.time()
+
+        ds = torch_data.Dataset.from_generator(range, args=(2,))
+        ds = ds.map(lambda x: torch_data.Dataset.from_generator(records, args=(x,)),
+                    num_parallel_calls=2, ordered=True)
+
+        ds_iter = iter(ds)
+        first = next(ds_iter)
+        received = time.time()
+
+        out = [first] + list(ds_iter)
+        self.assertEqual([(x, i) for x, i, _ in out], [(x, i) for x in range(2) for i in range(20000)])
+        # the first records arrive before the nested dataset has been drained
+        self.assertLess(received, out[1000][2])
+
+    def test_map_worker_init_fn(self):
+        import itertools
+
+        inits = itertools.count()
+
+        def init():
+            return {'table': [i * 10 for i in range(100)], 'init': next(inits)}
+
+        ds = torch_data.Dataset.from_generator(range, args=(100,))
+        for kwargs in ({}, {'num_parallel_calls': 3, 'executor': 'thread'}):
+            mapped = ds.map(lambda state, x: (state['table'][x], state['init']), worker_init_fn=init, **kwargs)
+            for _ in range(2):
+                self.assertEqual(sorted(mapped), [(x * 10, 0) for x in range(100)])
+
+            inits = itertools.count()
+
+    def test_parallel_map_worker_init_fn(self):
+        import uuid
+
+        def init():
+            return uuid.uuid4().hex
+
+        ds = torch_data.Dataset.from_generator(range, args=(100,))
+        ds = ds.map(lambda state, x: (x, state), num_parallel_calls=3, worker_init_fn=init)
+
+        epoch_1 = list(ds)
+        epoch_2 = list(ds)
+        self.assertEqual(sorted(x for x, _ in epoch_1), list(range(100)))
+
+        # every worker has created its state once and has reused it in the second epoch
+        states = set(state for _, state in epoch_1 + epoch_2)
+        self.assertLessEqual(len(states), 3)
+
+    def test_parallel_map_shared_closure(self):
+        import numpy as np
+        import torch
+
+        table = np.arange(1 << 20, dtype=np.float64)
+        weights = torch.arange(1 << 18, dtype=torch.float32)
+
+        ds = torch_data.Dataset.from_generator(range, args=(10,))
+        ds = ds.map(lambda x: (float(table[x]), float(weights[x])), num_parallel_calls=2, ordered=True)
+
+        for _ in range(2):
+            self.assertEqual(list(ds), [(float(x), float(x)) for x in range(10)])
+
+        # the captured arrays are in shared memory, only the rest of the closure is sent to the workers
+        map_func_dump, _ = ds._Dataset__source._dumps
+        self.assertLess(len(map_func_dump.data), 1 << 16)
+
+        def update(x):
+            # the writes of a worker go to its own copy of the pages
+            weights.add_(1)
+            table[0] = -1
+            return float(table[0])
+
+        ds = torch_data.Dataset.from_generator(range, args=(10,))
+        self.assertEqual(list(ds.map(update, num_parallel_calls=2)), [-1.0] * 10)
+        self.assertEqual(float(weights[0]), 0.0)
+        self.assertEqual(float(table[0]), 0.0)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/maps'), 'requires procfs')
+    def test_parallel_map_shared_closure_released(self):
+        import gc
+        import numpy as np
+
+        def mapped_segments(pid):
+            with open(f'/proc/{pid}/maps') as f:
+                return [line for line in f if pool.shm_prefix in line]
+
+        with torch_data.ProcessPool(1) as pool:
+            table = np.arange(1 << 20, dtype=np.float64)
+            ds = torch_data.Dataset.from_generator(range, args=(10,)).map(lambda x: float(table[x]), pool=pool)
+            self.assertEqual(list(ds), [float(x) for x in range(10)])
+
+            pid = pool._pool[0]._process.pid
+            self.assertTrue(mapped_segments(pid))
+
+            del ds
+            gc.collect()
+
+            # the eviction of the dropped map is processed by the worker before the next task
+            ds = torch_data.Dataset.from_generator(range, args=(1,)).map(lambda x: x, pool=pool)
+            self.assertEqual(list(ds), [0])
+            self.assertEqual(mapped_segments(pid), [])
+
+    def test_parallel_map_timeout(self):
+        import time
+
+        def map_func(x):
+            if x in (3, 4):
+                time.sleep(1.0)
+            return x
+
+        ds = torch_data.Dataset.from_generator(range, args=(20,))
+        expected = [x for x in range(20) if x not in (3, 4)]
+
+        # both workers are held by the slow samples, which are awaited before the rest of the samples are sent
+        with torch_data.ProcessPool(2) as pool:
+            mapped = ds.map(map_func, num_parallel_calls=2, ordered=True, pool=pool, timeout=0.3, on_timeout='skip')
+            self.assertEqual(list(mapped), expected)
+
+        with torch_data.ProcessPool(2) as pool:
+            mapped = ds.map(map_func, num_parallel_calls=2, ordered=True, pool=pool, timeout=0.3)
+            self.assertRaises(TimeoutError, list, mapped)
+
+        with torch_data.ProcessPool(2) as pool:
+            mapped = ds.map(map_func, num_parallel_calls=2, ordered=True, pool=pool, timeout=0.3,
+                            ignore_errors=True)
+            self.assertEqual(list(mapped), expected)
+
+    def test_parallel_map_timeout_retry(self):
+        import os
+        import tempfile
+        import time
+
+        with tempfile.TemporaryDirectory() as tmp:
+            flag = os.path.join(tmp, 'slow')
+
+            def map_func(x):
+                # only the first run of the sample is slow, its result tells which run has been taken
+                if x == 5 and not os.path.exists(flag):
+                    open(flag, 'w').close()
+                    time.sleep(1.0)
+                    return -1
+                return x * 2
+
+            ds = torch_data.Dataset.from_generator(range, args=(20,))
+            with torch_data.ProcessPool(2) as pool:
+                mapped = ds.map(map_func, num_parallel_calls=2, ordered=True, pool=pool, timeout=0.3,
+                                on_timeout='retry')
+                self.assertEqual(list(mapped), [x * 2 for x in range(20)])
+
+    def test_shard(self):
+        import numpy as np
+
+        ds = torch_data.Dataset.from_generator(range, args=(10,)).map(lambda x: x * 2)
+        self.assertEqual(list(ds.shard(3, 1)), [2, 8, 14])
+        self.assertEqual(list(ds.shard(3, 1).shard(2, 1)), [8])
+
+        ds = torch_data.Dataset.from_tensor_slices(list(range(10)), list(range(10, 20)))
+        self.assertEqual(list(ds.shard(4, 3)), [(3, 13), (7, 17)])
+
+        ds = torch_data.Dataset.from_tensors([1, 2])
+        self.assertEqual(list(ds.shard(2, 0)), [([1, 2],)])
+        self.assertEqual(list(ds.shard(2, 1)), [])
+
+        def gen(n, shard):
+            index, num_shards = shard or (0, 1)
+            yield from range(index, n, num_shards)
+
+        ds = torch_data.Dataset.from_generator(gen, args=(10,), shard_aware=True)
+        self.assertEqual(list(ds), list(range(10)))
+        self.assertEqual(list(ds.shard(5, 2)), [2, 7])
+
+        # the shard is taken from the output of the dataset, also of operations which do not map an element to one
+        ds = torch_data.Dataset.from_generator(range, args=(10,))
+        self.assertEqual(list(ds.filter(lambda x: x % 2 == 0).shard(2, 0)), [0, 4, 8])
+        ds = torch_data.Dataset.from_tensor_slices(np.arange(8)).batch(2).shard(2, 0)
+        self.assertEqual([b.tolist() for b in ds], [[0, 1], [4, 5]])
+        ds = torch_data.Dataset.from_tensors(np.arange(6).reshape(3, 2)).unbatch().shard(2, 1)
+        self.assertEqual([a.tolist() for a, in ds], [[2, 3]])
+
+        ds = torch_data.Dataset.from_generator(range, args=(4,))
+        ds = ds.map(lambda x: torch_data.Dataset.from_tensor_slices([x, x])).shard(2, 0)
+        self.assertEqual(list(ds), [0, 1, 2, 3])
+        # datasets created by the replicas of the pipeline are not sharded
+        ds = torch_data.Dataset.from_generator(range, args=(4,))
+        ds = ds.map(lambda x: torch_data.Dataset.from_tensor_slices([x, x])).shard_parallel(2)
+        self.assertEqual(sorted(ds), [0, 0, 1, 1, 2, 2, 3, 3])
+
+    def test_shard_parallel(self):
+        import os
+
+        def read(x):
+            return x, os.getpid()
+
+        ds = torch_data.Dataset.from_generator(range, args=(1000,))
+        ds = ds.filter(lambda x: x % 3).map(read).shard_parallel(4)
+
+        out = list(ds)
+        self.assertEqual(sorted(x for x, _ in out), [x for x in range(1000) if x % 3])
+        self.assertNotIn(os.getpid(), set(pid for _, pid in out))
+
+    def test_thread_map_ordered(self):
+        import threading
+
+        main_thread = threading.get_ident()
+
+        def map_func(x):
+            self.assertNotEqual(threading.get_ident(), main_thread)
+            return x**2
+
+        ds = torch_data.Dataset.from_generator(range, args=(100,))
+        ds = ds.map(map_func, num_parallel_calls=3, ordered=True, executor='thread')
+
+        for i, r in enumerate(ds):
+            self.assertEqual(i**2, r)
+
+        self.assertEqual(i, 99)
+
+    def test_thread_map_ds_unordered(self):
+        ds = torch_data.Dataset.from_generator(range, args=(100,))
+        ds = ds.map(lambda x: torch_data.Dataset.from_tensor_slices([x, x**2]), num_parallel_calls=3,
+                    ordered=False, executor='thread')
+
+        self.assertEqual(sorted(ds), sorted(list(range(100)) + [i**2 for i in range(100)]))
+
+    def test_thread_map_errors(self):
+        def map_func(x):
+            if x % 10 == 0:
+                raise ValueError(x)
+            return x
+
+        ds = torch_data.Dataset.from_generator(range, args=(100,))
+        self.assertRaises(ValueError, list, ds.map(map_func, num_parallel_calls=3, executor='thread'))
+
+        import contextlib
+        import io
+        with contextlib.redirect_stderr(io.StringIO()):
+            out = list(ds.map(map_func, num_parallel_calls=3, ordered=True, ignore_errors=True, executor='thread'))
+
+        self.assertEqual(out, [i for i in range(100) if i % 10])
+
+    def test_async_map_ordered(self):
+        import asyncio
+
+        state = {'running': 0, 'max_running': 0}
+
+        async def map_func(x):
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+            await asyncio.sleep(0.01 * (x % 3))
+            state['running'] -= 1
+            return x**2
+
+        ds = torch_data.Dataset.from_generator(range, args=(100,))
+        ds = ds.map(map_func, num_parallel_calls=4, ordered=True)
+
+        self.assertEqual(list(ds), [i**2 for i in range(100)])
+        self.assertEqual(state['max_running'], 4)
+
+    def test_async_map_ds_unordered(self):
+        import asyncio
+
+        async def map_func(x):
+            await asyncio.sleep(0.001 * (x % 5))
+            return torch_data.Dataset.from_tensor_slices([x, x**2])
+
+        ds = torch_data.Dataset.from_generator(range, args=(100,))
+        ds = ds.map(map_func, num_parallel_calls=8, ordered=False)
+
+        self.assertEqual(sorted(ds), sorted(list(range(100)) + [i**2 for i in range(100)]))
+
+    def test_parallel_map_large_samples(self):
+        import numpy as np
+        import torch
+
+        arrays = [np.full((64, 1024), i, dtype=np.float32) for i in range(10)]
+
+        ds = torch_data.Dataset.from_tensor_slices(arrays)
+        ds = ds.map(lambda x: (x + 1, torch.from_numpy(x) * 2), num_parallel_calls=2, ordered=True)
+
+        for i, (a, t) in enumerate(ds):
+            self.assertTrue(isinstance(a, np.ndarray))
+            self.assertTrue(np.all(a == i + 1))
+            self.assertTrue(a.flags.writeable)
+
+            self.assertTrue(isinstance(t, torch.Tensor))
+            self.assertEqual(tuple(t.shape), (64, 1024))
+            self.assertTrue(torch.all(t == 2 * i))
+
+        self.assertEqual(i, 9)
+
+    def test_parallel_map_unpickling_errors(self):
+        class Unloadable:
+            def __reduce__(self):
+                return int, ('not a number',)
+
+        ds = torch_data.Dataset.from_generator(list, args=([0, 1, Unloadable(), 3],))
+
+        mapped = ds.map(lambda x: x, num_parallel_calls=2, ordered=True, chunk_size=1, ignore_errors=True)
+        self.assertEqual(list(mapped), [0, 1, 3])
+
+        mapped = ds.map(lambda x: x, num_parallel_calls=2, ordered=True, chunk_size=1)
+        self.assertRaises(RuntimeError, list, mapped)
+
+    def test_parallel_map_main_module(self):
+        import os
+        import subprocess
+        import sys
+        import tempfile
+
+        # functions and classes of a script are not importable by the spawned workers
+        script = (
+            'import torch_data\n'
+            'if __name__ == "__main__":\n'
+            '    class Sample:\n'
+            '        def __init__(self, x):\n'
+            '            self.x = x\n'
+            '    def square(sample):\n'
+            '        return sample.x ** 2\n'
+            '    ds = torch_data.Dataset.from_generator(range, args=(10,)).map(Sample)\n'
+            '    with torch_data.ProcessPool(1) as pool:\n'
+            '        print(list(ds.map(square, pool=pool, ordered=True)))\n'
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'script.py')
+            with open(path, 'w') as f:
+                f.write(script)
+
+            env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(torch_data.__file__)))
+            out = subprocess.run([sys.executable, path], env=env, capture_output=True, text=True, timeout=120)
+
+        self.assertEqual(out.stdout.strip(), str([x ** 2 for x in range(10)]), out.stderr)
+
+    def test_parallel_map_abandoned(self):
+        import gc
+        import glob
+        import time
+        import numpy as np
+        from torch_data._ops import _map, _transport
+
+        ds = torch_data.Dataset.from_tensor_slices([np.full((64, 1024), i, dtype=np.float32) for i in range(50)])
+        ds = ds.map(lambda x: x + 1, num_parallel_calls=2)
+
+        it = iter(ds)
+        self.assertTrue(np.all(next(it) == 1))
+        del it
+        gc.collect()
+
+        # the pool is still usable after an iterator has been dropped with samples in process
+        self.assertEqual(len(list(ds)), 50)
+
+        time.sleep(0.5)
+        pattern = _transport._shm_dir() + '/' + _map.ProcessPool.default().shm_prefix + '*'
+        self.assertEqual(glob.glob(pattern), [])
+
     def test_shuffle(self):
         tensor1 = list(range(100))
         tensor2 = [str(i) + 'i' for i in range(100)]
@@ -180,6 +670,111 @@ class TestDataset(unittest.TestCase):
         self.assertEqual(len(tensor2), len(out2))
         self.assertNotEqual(tuple(tensor2), tuple(out2))
 
+    def test_shuffle_epochs(self):
+        def make(**kwargs):
+            return torch_data.Dataset.from_generator(range, args=(100,)).shuffle(10, **kwargs)
+
+        ds = make(seed=1)
+        epochs = [list(ds) for _ in range(3)]
+        for epoch in epochs:
+            self.assertEqual(sorted(epoch), list(range(100)))
+        self.assertNotEqual(epochs[0], epochs[1])
+        self.assertNotEqual(epochs[1], epochs[2])
+
+        # every epoch is reproducible, also when the epochs run concurrently
+        self.assertEqual([list(make(seed=1)) for _ in range(1)], epochs[:1])
+        self.assertEqual(list(make(seed=1).repeat(3)), sum(epochs, []))
+        self.assertNotEqual(list(make(seed=2)), epochs[0])
+
+        ds = make(seed=1, reshuffle_each_iteration=False)
+        self.assertEqual(list(ds), epochs[0])
+        self.assertEqual(list(ds), epochs[0])
+        ds = make(reshuffle_each_iteration=False)
+        self.assertEqual(list(ds), list(ds))
+
+        # the buffer holds the next `buffer_size` elements
+        for epoch in epochs:
+            self.assertTrue(all(x < i + 10 for i, x in enumerate(epoch)))
+
+        ds = torch_data.Dataset.from_tensor_slices(list(range(100))).shuffle(seed=1, reshuffle_each_iteration=False)
+        self.assertEqual(list(ds), list(ds))
+
+    def test_shuffle_permutation(self):
+        import numpy as np
+
+        array = np.arange(1000)
+        ds = torch_data.Dataset.from_tensor_slices(array, [str(i) for i in range(1000)]).shuffle(seed=1)
+
+        epochs = [[a.item() for a, _ in ds] for _ in range(3)]
+        for epoch in epochs:
+            self.assertEqual(sorted(epoch), list(range(1000)))
+            self.assertNotEqual(epoch, list(range(1000)))
+        # every epoch has another order, the orders are reproducible
+        self.assertNotEqual(epochs[0], epochs[1])
+        ds = torch_data.Dataset.from_tensor_slices(array, [str(i) for i in range(1000)]).shuffle(seed=1)
+        self.assertEqual([[a.item() for a, _ in ds] for _ in range(3)], epochs)
+
+        # the shuffled source is read by index
+        ds = torch_data.Dataset.from_tensor_slices(array).shuffle(seed=2)
+        batches = list(ds.batch(100))
+        self.assertEqual(sorted(np.concatenate(batches).tolist()), list(range(1000)))
+        self.assertEqual(len(list(ds.skip(990))), 10)
+        self.assertEqual(sorted(x.item() for x in ds.repeat(2)), sorted(list(range(1000)) * 2))
+
+        # a shard of the shuffled dataset is a shard of its order
+        ds = torch_data.Dataset.from_tensor_slices(array).shuffle(seed=2, reshuffle_each_iteration=False)
+        self.assertEqual(list(ds.shard(4, 1)), list(ds)[1::4])
+        shards = [list(ds.shard(3, i)) for i in range(3)]
+        self.assertEqual(sorted(np.concatenate(shards).tolist()), list(range(1000)))
+
+        self.assertRaises(AssertionError, torch_data.Dataset.from_generator(range, args=(5,)).shuffle)
+
+    def test_shuffle_external(self):
+        import numpy as np
+        import tempfile
+
+        def gen():
+            for i in range(1000):
+                yield i, np.full(100, i, dtype=np.int64)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            ds = torch_data.Dataset.from_generator(gen).shuffle(seed=1, memory_budget=8 << 10, spill_directory=tmp)
+
+            epochs = []
+            for _ in range(3):
+                epoch = []
+                for i, array in ds:
+                    self.assertTrue(np.array_equal(array, np.full(100, i)))
+                    epoch.append(i)
+                epochs.append(epoch)
+                # the buckets are removed once they are read
+                self.assertEqual(os.listdir(tmp), [])
+
+            for epoch in epochs:
+                self.assertEqual(sorted(epoch), list(range(1000)))
+            # the elements are not kept near their positions, unlike with a buffer
+            self.assertTrue(any(i - epochs[0].index(i) > 500 for i in range(1000)))
+            self.assertNotEqual(epochs[0], epochs[1])
+
+            ds = torch_data.Dataset.from_generator(gen).shuffle(seed=1, memory_budget=8 << 10, spill_directory=tmp)
+            self.assertEqual([[i for i, _ in ds] for _ in range(3)], epochs)
+
+            # an early stop removes the buckets as well
+            it = iter(ds)
+            next(it)
+            del it
+            self.assertEqual(os.listdir(tmp), [])
+
+        ds = torch_data.Dataset.from_generator(range, args=(100,)).shuffle(seed=1, memory_budget=1 << 20)
+        self.assertEqual(sorted(ds), list(range(100)))
+        self.assertEqual(sorted(ds.batch(10).unbatch()), list(range(100)))
+        self.assertEqual(list(torch_data.Dataset.from_generator(range, args=(0,)).shuffle(memory_budget=1)), [])
+
+        self.assertRaises(AssertionError, torch_data.Dataset.from_generator(range, args=(5,)).shuffle, 2,
+                          memory_budget=1 << 20)
+        self.assertRaises(AssertionError, torch_data.Dataset.from_generator(range, args=(5,)).shuffle, 2,
+                          spill_directory='.')
+
     def test_batch(self):
         tensor1 = list(range(100))
         tensor2 = [str(i) + 'i' for i in range(100)]
@@ -304,6 +899,38 @@ class TestDataset(unittest.TestCase):
         except (ImportError, ModuleNotFoundError):
             pass
 
+    def test_batch_random_access(self):
+        import numpy as np
+        import torch
+
+        array = np.arange(30, dtype=np.float32).reshape(10, 3)
+        tensor = torch.arange(10)
+
+        def rows():
+            yield from zip(array, tensor)
+
+        for drop_last in (True, False):
+            # the batches of the slices are those of the rows
+            fast = list(torch_data.Dataset.from_tensor_slices(array, tensor).batch(4, drop_last=drop_last))
+            slow = list(torch_data.Dataset.from_generator(rows).batch(4, drop_last=drop_last))
+            self.assertEqual(len(fast), len(slow))
+            for (a, t), (slow_a, slow_t) in zip(fast, slow):
+                self.assertIsInstance(a, np.ndarray)
+                self.assertEqual(a.dtype, slow_a.dtype)
+                np.testing.assert_array_equal(a, slow_a)
+                self.assertTrue(torch.equal(t, slow_t))
+
+        # a batch of consecutive rows is a view
+        batches = list(torch_data.Dataset.from_tensor_slices(array).batch(5))
+        self.assertTrue(all(np.shares_memory(b, array) for b in batches))
+
+        ds = torch_data.Dataset.from_tensor_slices(array).shard(3, 1).batch(2, drop_last=False)
+        self.assertEqual([b[:, 0].tolist() for b in ds], [[3, 12], [21, 0]])
+
+        # lists are batched as before
+        ds = torch_data.Dataset.from_tensor_slices(array, ['a'] * 10).batch(4)
+        self.assertEqual([b[1] for b in ds], [['a'] * 4] * 2)
+
     def test_window(self):
         tensor1 = list(range(100))
         tensor2 = [str(i) + 'i' for i in range(100)]
@@ -428,6 +1055,203 @@ class TestDataset(unittest.TestCase):
         for i, r in enumerate(ds):
             self.assertEqual(i, r)
 
+    def test_prefetch(self):
+        import asyncio
+
+        async def slow_gen():
+            for i in range(20):
+                await asyncio.sleep(0.001)
+                yield i
+
+        ds = torch_data.Dataset.from_generator(slow_gen).prefetch(4)
+        self.assertEqual(list(ds), list(range(20)))
+
+        def broken_gen():
+            yield 0
+            raise ValueError('broken')
+
+        ds = torch_data.Dataset.from_generator(broken_gen).prefetch(4)
+        ds_iter = iter(ds)
+
+        self.assertEqual(next(ds_iter), 0)
+        self.assertRaises(ValueError, next, ds_iter)
+
+    def test_repeat(self):
+        import itertools
+
+        ds = torch_data.Dataset.from_generator(range, args=(3,))
+        self.assertEqual(list(ds.repeat(2)), [0, 1, 2] * 2)
+        self.assertEqual(list(ds.repeat(0)), [])
+        self.assertEqual(list(itertools.islice(ds.repeat(), 10)), [0, 1, 2] * 3 + [0])
+
+        # an empty dataset is not repeated forever
+        self.assertEqual(list(torch_data.Dataset.from_generator(range, args=(0,)).repeat()), [])
+
+        mapped = ds.map(lambda x: x * 2, num_parallel_calls=2, ordered=True).repeat(3)
+        self.assertEqual(list(mapped), [0, 2, 4] * 3)
+
+        self.assertEqual(list(ds.repeat(2).shard(2, 1)), [1, 0, 2])
+        self.assertEqual([b.tolist() for b in ds.repeat(2).batch(2)], [[0, 1], [2, 0], [1, 2]])
+
+    def test_cache(self):
+        import gc
+        import tempfile
+
+        import numpy as np
+
+        calls = []
+
+        def gen(n):
+            calls.append(n)
+            for i in range(n):
+                yield {'x': i, 'a': np.full(1000, i, dtype=np.float32)}
+
+        ds = torch_data.Dataset.from_generator(gen, args=(5,)).cache()
+
+        # an interrupted pass is not recorded
+        ds_iter = iter(ds)
+        next(ds_iter)
+        ds_iter.close()
+
+        for _ in range(3):
+            self.assertEqual([s['x'] for s in ds], list(range(5)))
+        self.assertEqual(len(calls), 2)
+
+        # the next epoch waits for the recording of the current one
+        calls.clear()
+        ds = torch_data.Dataset.from_generator(gen, args=(5,)).cache()
+        self.assertEqual([s['x'] for s in ds.repeat(3)], list(range(5)) * 3)
+        self.assertEqual(len(calls), 1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache')
+
+            calls.clear()
+            ds = torch_data.Dataset.from_generator(gen, args=(5,)).cache(path)
+            ds_iter = iter(ds)
+            next(ds_iter)
+            ds_iter.close()
+            del ds_iter
+            gc.collect()
+            self.assertEqual(os.listdir(tmp), [])
+
+            self.assertEqual([s['x'] for s in ds], list(range(5)))
+            self.assertEqual(os.listdir(tmp), ['cache'])
+
+            # the file is reused by another dataset and its arrays are writable
+            ds = torch_data.Dataset.from_generator(gen, args=(5,)).cache(path)
+            samples = list(ds)
+            self.assertEqual(len(calls), 2)
+            for i, s in enumerate(samples):
+                np.testing.assert_array_equal(s['a'], np.full(1000, i, dtype=np.float32))
+                s['a'][0] = -1
+            self.assertEqual(list(ds)[0]['a'][0], 0)
+
+            # every shard has a file
+            ds = torch_data.Dataset.from_generator(range, args=(10,)).cache(os.path.join(tmp, 'sharded'))
+            self.assertEqual(sorted(ds.shard_parallel(2)), list(range(10)))
+            self.assertEqual(sorted(ds.shard_parallel(2)), list(range(10)))
+            self.assertEqual(sorted(f for f in os.listdir(tmp) if f.startswith('sharded')),
+                             ['sharded.shard-0-of-2', 'sharded.shard-1-of-2'])
+
+    def test_snapshot(self):
+        import gc
+        import tempfile
+
+        import numpy as np
+
+        # the calls are counted in a global, the contents of a closure are a part of the fingerprint
+        calls = _snapshot_calls
+
+        def make(n, **kwargs):
+            ds = torch_data.Dataset.from_generator(_snapshot_gen, args=(n,)).map(lambda i, a: (i, a * 2))
+            return ds.snapshot(tmp, **kwargs)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # an interrupted pass leaves no files
+            ds_iter = iter(make(10))
+            next(ds_iter)
+            ds_iter.close()
+            del ds_iter
+            gc.collect()
+            self.assertEqual([os.listdir(os.path.join(tmp, d)) for d in os.listdir(tmp)], [[]])
+
+            calls.clear()
+            for _ in range(2):
+                samples = list(make(10, num_writers=3))
+                self.assertEqual([i for i, _ in samples], list(range(10)))
+                for i, a in samples:
+                    np.testing.assert_array_equal(a, np.full(2000, i * 2))
+                    a[0] = -1
+            self.assertEqual(len(calls), 1)
+
+            # another pipeline has another snapshot
+            calls.clear()
+            self.assertEqual([i for i, _ in make(5)], list(range(5)))
+            self.assertEqual([i for i, _ in make(5)], list(range(5)))
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(len(os.listdir(tmp)), 2)
+
+            # the files of the snapshot, [0, 3, 6, 9], [1, 4, 7] and [2, 5, 8], are shuffled and split between the shards
+            ds = make(10, shuffle_files=True, seed=1)
+            self.assertEqual(sorted(i for i, _ in ds), list(range(10)))
+            self.assertEqual(sorted(i for i, _ in ds.shard_parallel(2)), list(range(10)))
+            orders = set(tuple(i for i, _ in ds) for _ in range(10))
+            self.assertGreater(len(orders), 1)
+
+        for compression in ('zlib', 'lzma'):
+            with tempfile.TemporaryDirectory() as tmp:
+                for _ in range(2):
+                    samples = list(make(10, num_writers=3, compression=compression))
+                    self.assertEqual([i for i, _ in samples], list(range(10)))
+                    for i, a in samples:
+                        np.testing.assert_array_equal(a, np.full(2000, i * 2))
+                        a[0] = -1
+
+                directory = os.path.join(tmp, os.listdir(tmp)[0])
+                files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.rec')]
+                self.assertLess(sum(os.path.getsize(f) for f in files), 10 * 2000 * 8 // 10)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # every shard writes its files, the next pass with the same number of shards reads them
+            calls.clear()
+            ds = make(10, num_writers=2)
+            self.assertEqual(sorted(i for i, _ in ds.shard_parallel(2)), list(range(10)))
+            self.assertEqual(sorted(i for i, _ in ds.shard_parallel(2)), list(range(10)))
+            self.assertEqual(sorted(i for i, _ in ds), list(range(10)))
+            self.assertEqual(len(os.listdir(os.path.join(tmp, os.listdir(tmp)[0]))), 6)
+
+    def test_sync_iterator(self):
+        import asyncio
+        import gc
+        import threading
+
+        n_threads = threading.active_count()
+
+        ds = torch_data.Dataset.from_generator(range, args=(10**6,))
+
+        ds_iter = iter(ds)
+        self.assertEqual(next(ds_iter), 0)
+        ds_iter.close()
+        self.assertRaises(StopIteration, next, ds_iter)
+
+        ds_iter = iter(ds)
+        self.assertEqual(next(ds_iter), 0)
+        del ds_iter
+        gc.collect()
+
+        self.assertEqual(threading.active_count(), n_threads)
+
+        # inside of a running event loop
+        async def consume():
+            return list(torch_data.Dataset.from_generator(range, args=(100,)))
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(consume()), list(range(100)))
+        finally:
+            loop.close()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,131 @@
+import os
+import time
+import unittest
+
+import torch_data
+
+
+def _cpu_time(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class TestProcessPool(unittest.TestCase):
+    @unittest.skipUnless(os.path.exists('/proc/self/stat'), 'requires procfs')
+    def test_idle_workers(self):
+        from torch_data._ops._map import ProcessPool
+
+        # the pool is started by the first parallel map
+        ds = torch_data.Dataset.from_generator(range, args=(100,))
+        ds = ds.map(lambda x: x**2, num_parallel_calls=2)
+        self.assertEqual(sorted(ds), [x**2 for x in range(100)])
+
+        pids = [p._process.pid for p in ProcessPool.default()._pool]
+
+        time.sleep(0.5)
+        before = [_cpu_time(pid) for pid in pids]
+        time.sleep(1.0)
+        after = [_cpu_time(pid) for pid in pids]
+
+        for b, a in zip(before, after):
+            self.assertLess(a - b, 0.1)
+
+    def test_explicit_pool(self):
+        with torch_data.ProcessPool(2, start_method='forkserver', preload=['numpy']) as pool:
+            # workers are started by the first task
+            self.assertIsNone(pool._pool)
+
+            ds = torch_data.Dataset.from_generator(range, args=(100,))
+            ds = ds.map(lambda x: x**2, pool=pool)
+
+            self.assertEqual(sorted(ds), [x**2 for x in range(100)])
+            pids = [p._process.pid for p in pool._pool]
+            self.assertEqual(len(pids), 2)
+
+            # the next epoch runs in the same workers
+            self.assertEqual(sorted(ds), [x**2 for x in range(100)])
+            self.assertEqual([p._process.pid for p in pool._pool], pids)
+
+        self.assertTrue(pool.closed)
+        self.assertRaises(AssertionError, list, ds)
+
+    def test_pool_worker_init_fn(self):
+        def init():
+            os.environ['TORCH_DATA_TEST_WORKER'] = str(os.getpid())
+            return {'pid': os.getpid()}
+
+        with torch_data.ProcessPool(2, worker_init_fn=init) as pool:
+            ds = torch_data.Dataset.from_generator(range, args=(10,))
+            mapped = ds.map(lambda state, x: (os.getpid(), os.environ.get('TORCH_DATA_TEST_WORKER'), state['pid']),
+                            pool=pool)
+
+            for pid, value, state_pid in mapped:
+                self.assertEqual(str(pid), value)
+                self.assertEqual(pid, state_pid)
+
+            # the state of a map takes the place of the state of the pool
+            mapped = ds.map(lambda state, x: state, pool=pool, worker_init_fn=lambda: 'map')
+            self.assertEqual(list(mapped), ['map'] * 10)
+
+            mapped = ds.map(lambda state, x: state['pid'], num_parallel_calls=0, pool=pool)
+            self.assertEqual(list(mapped), [os.getpid()] * 10)
+
+            self.assertEqual(sorted(ds.shard_parallel(pool=pool)), list(range(10)))
+
+        os.environ.pop('TORCH_DATA_TEST_WORKER', None)  # the serial map has initialized this process
+
+    def test_finished_channels(self):
+        import gc
+
+        def count_buffers(_):
+            from torch_data._buffer import ThreadSafeBuffer
+            gc.collect()
+            return sum(isinstance(obj, ThreadSafeBuffer) for obj in gc.get_objects())
+
+        with torch_data.ProcessPool(1) as pool:
+            ds = torch_data.Dataset.from_generator(range, args=(10,))
+            for _ in range(20):
+                self.assertEqual(len(list(ds.map(lambda x: x, pool=pool))), 10)
+            gc.collect()
+
+            # the channels of the finished maps have been released by the worker
+            counted = list(torch_data.Dataset.from_generator(range, args=(1,)).map(count_buffers, pool=pool))
+            self.assertLess(counted[0], 5)
+
+    def test_worker_threads(self):
+        def threads(_):
+            import torch
+            return torch.get_num_threads(), os.environ.get('OMP_NUM_THREADS')
+
+        ds = torch_data.Dataset.from_generator(range, args=(2,))
+
+        with torch_data.ProcessPool(1, num_threads=2) as pool:
+            self.assertEqual(list(ds.map(threads, pool=pool)), [(2, '2')] * 2)
+
+        # the environment of the parent is restored once the workers have been started
+        self.assertNotEqual(os.environ.get('OMP_NUM_THREADS'), '2')
+
+    @unittest.skipUnless(hasattr(os, 'sched_setaffinity'), 'requires sched_setaffinity')
+    def test_worker_cpu_affinity(self):
+        cpu = min(os.sched_getaffinity(0))
+        ds = torch_data.Dataset.from_generator(range, args=(2,))
+
+        with torch_data.ProcessPool(cpu_affinity=[cpu]) as pool:
+            self.assertEqual(pool.n_workers, 1)
+            self.assertEqual(list(ds.map(lambda x: os.sched_getaffinity(0), pool=pool)), [{cpu}] * 2)
+
+        with torch_data.ProcessPool(cpu_affinity=[[cpu], [cpu]]) as pool:
+            self.assertEqual(pool.n_workers, 2)
+
+    def test_eager_pool(self):
+        pool = torch_data.ProcessPool(1, lazy=False)
+        self.assertEqual(len(pool._pool), 1)
+
+        pool.shutdown()
+        self.assertIsNone(pool._pool)
+
+
+if __name__ == '__main__':
+    unittest.main()